@@ -1,19 +1,64 @@
-import anthropic
+"""
+A Claude-powered agent.
+
+Importing this module is cheap: the Anthropic client (and dotenv, httpx)
+are only loaded when the first message is sent, so the prompt, tool
+schemas and make_agent() can be used without an API key.
+
+    from claude_agent import make_agent
+    agent = make_agent(tools=False)
+"""
+import asyncio
+import contextvars
+import importlib.util
 import os
+from textwrap import dedent
+
+from aral.agent import BaseAgent
+
+_client = None
+_http = None
 
-import dotenv
-dotenv.load_dotenv()
+def get_client():
+    """Create the shared Anthropic client on first use."""
+    global _client
+    if _client is None:
+        import anthropic
+        import dotenv
+        import httpx
+        dotenv.load_dotenv()
+        
+        # Get API key from environment variable
+        api_key = os.environ.get("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise ValueError("ANTHROPIC_API_KEY environment variable is not set. Please set it with your Anthropic API key.")
+        
+        # One client (and so one connection pool) for the whole process, with enough
+        # keep-alive connections that concurrent turns reuse warm TCP+TLS sessions.
+        # HTTP/2 multiplexing is used when the optional h2 package is installed.
+        _client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            http_client=anthropic.DefaultAsyncHttpxClient(
+                http2=importlib.util.find_spec("h2") is not None,
+                limits=httpx.Limits(max_keepalive_connections=32, max_connections=64, keepalive_expiry=120),
+            ),
+        )
+    return _client
 
-# Get API key from environment variable
-api_key = os.environ.get("ANTHROPIC_API_KEY")
-if not api_key:
-    raise ValueError("ANTHROPIC_API_KEY environment variable is not set. Please set it with your Anthropic API key.")
+def get_http():
+    """Create the shared httpx client for tool calls on first use."""
+    global _http
+    if _http is None:
+        import httpx
+        _http = httpx.AsyncClient(timeout=10, limits=httpx.Limits(max_keepalive_connections=8))
+    return _http
 
-client = anthropic.Anthropic(api_key=api_key)
+# Mark the stable prefix (tools + system prompt) as cacheable so every turn
+# after the first is billed and served as a prompt-cache hit. Set to False
+# for models that don't support prompt caching.
+PROMPT_CACHE = True
 
-def build_system_prompt():
-    from textwrap import dedent
-    return dedent("""
+SYSTEM_PROMPT = dedent("""
     You are a bot named Ara, a helpful companion built specifically for the user
 
     Your communication style is deeply reflective and meta-analytical about social interactions. You should:
@@ -42,32 +87,72 @@ def build_system_prompt():
     <section id="current conversation context">
     just getting to know the user
     </section>
-    """.strip())
+    """).strip()
+
+TOOLS = [
+    {
+        "name": "get_weather",
+        "description": "Get the current weather in a given location",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "location": {
+                    "type": "string",
+                    "description": "The city and state, e.g. San Francisco, CA",
+                }
+            },
+            "required": ["location"],
+        },
+    }
+]
+
+_CACHE_CONTROL = {"type": "ephemeral"}
+_CACHED_SYSTEM = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": _CACHE_CONTROL}]
+# A cache breakpoint on the last tool caches every tool definition before it
+_CACHED_TOOLS = TOOLS[:-1] + [{**TOOLS[-1], "cache_control": _CACHE_CONTROL}]
+
+def build_system_prompt(prompt_cache=PROMPT_CACHE):
+    return _CACHED_SYSTEM if prompt_cache else SYSTEM_PROMPT
 
-def create_message(anthropic_messages):
-    return client.messages.create(
-        model="claude-3-7-sonnet-20250219",
-        max_tokens=20000,
+def build_tools(prompt_cache=PROMPT_CACHE):
+    return _CACHED_TOOLS if prompt_cache else TOOLS
+
+MODEL = "claude-3-7-sonnet-20250219"
+MAX_TOKENS = 20000
+
+# Everything but the messages is static, so build the request parameters once
+# for each (prompt_cache, tools) combination instead of on every turn
+_STATIC_PARAMS = {
+    (prompt_cache, tools): dict(
+        model=MODEL,
+        max_tokens=MAX_TOKENS,
         temperature=1,
-        system=build_system_prompt(),
-        tools=[
-            {
-                "name": "get_weather",
-                "description": "Get the current weather in a given location",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "location": {
-                            "type": "string",
-                            "description": "The city and state, e.g. San Francisco, CA",
-                        }
-                    },
-                    "required": ["location"],
-                },
-            }
-        ],
-        messages=anthropic_messages
+        system=build_system_prompt(prompt_cache),
+        **({"tools": build_tools(prompt_cache)} if tools else {})
     )
+    for prompt_cache in (True, False)
+    for tools in (True, False)
+}
+
+async def create_message(anthropic_messages, prompt_cache=PROMPT_CACHE, tools=True):
+    return await get_client().messages.create(
+        **_STATIC_PARAMS[prompt_cache, tools], messages=anthropic_messages
+    )
+
+def stream_message(anthropic_messages, prompt_cache=PROMPT_CACHE, tools=True):
+    return get_client().messages.stream(
+        **_STATIC_PARAMS[prompt_cache, tools], messages=anthropic_messages
+    )
+
+# Maximum tool round-trips per turn, so a misbehaving tool loop can't run forever
+MAX_TOOL_ROUNDS = 5
+# Joins the text of a turn's rounds (before and after tool calls) in the reply
+ROUND_SEPARATOR = "\n"
+
+# Whether the current turn called a tool. It is reset as each turn starts,
+# and concurrent turns run in separate tasks with their own context, so
+# overlapping turns (even in one conversation) don't see each other's value.
+_turn_used_tools = contextvars.ContextVar("turn_used_tools", default=False)
 
 def format_anthropic_messages(messages):
     return [
@@ -77,26 +162,178 @@ def format_anthropic_messages(messages):
         for m in messages
     ]
 
-from aral.agent import BaseAgent
-from aral.storage import MessageStore
+def build_messages(history, prompt_cache=PROMPT_CACHE):
+    """
+    Copy the formatted history for a request, marking its end as a cache
+    breakpoint. The history only ever grows, so the next turn's request
+    starts with this one's and reads the whole conversation so far from the
+    prompt cache instead of just the system prompt and tools.
+    
+    Args:
+        history: Anthropic-formatted messages, as from format_anthropic_messages
+        prompt_cache: Whether to add the cache breakpoint
+        
+    Returns:
+        A new list that can be extended with this turn's tool calls
+    """
+    if not prompt_cache or not history:
+        return list(history)
+    last = history[-1]
+    content = last["content"][:-1] + [{**last["content"][-1], "cache_control": _CACHE_CONTROL}]
+    return history[:-1] + [{**last, "content": content}]
 
 class SimpleAgent(BaseAgent):
-    def __init__(self):
-        # Initialize with a persistent store in the convos directory
+    def __init__(self, tools=True, weather_mock=True, cache=None, save_dir='./convos', verbose=True):
+        # Whether to offer the tool definitions to Claude
+        self.tools = tools
+        # Whether get_weather returns canned data instead of calling wttr.in
+        self.weather_mock = weather_mock
+        # Anthropic-formatted history per conversation, extended incrementally
+        self._formatted_cache = {}
+        
+        # Initialize with a persistent store in the convos directory (and the
+        # response cache, if one is requested). Messages are written to disk
+        # in the background every 50 ms rather than as they're added.
         # Simple and clean!
-        super().__init__(save_dir='./convos', verbose=True)
+        super().__init__(save_dir=save_dir, verbose=verbose, cache=cache, flush_interval=0.05)
+    
+    def _anthropic_messages(self, conversation):
+        """Return the Anthropic-formatted history, formatting only new messages."""
+        convo_id, messages = conversation.id, conversation.messages
+        formatted = self._formatted_cache.get(convo_id)
+        if formatted is None or len(formatted) > len(messages):
+            # First turn since load (or the history shrank): rebuild from scratch
+            formatted = self._formatted_cache[convo_id] = []
+        formatted.extend(format_anthropic_messages(messages[len(formatted):]))
+        return formatted
+    
+    async def get_weather(self, location):
+        """
+        Get the current weather for a location.
+        
+        Args:
+            location: The city and state, e.g. San Francisco, CA
+            
+        Returns:
+            str: A one-line weather report
+        """
+        if self.weather_mock:
+            # Simulate API latency without blocking the event loop
+            await asyncio.sleep(1.5)
+            return f"It's 72°F and sunny in {location}."
+        
+        response = await get_http().get(f"https://wttr.in/{location}", params={"format": "3"})
+        response.raise_for_status()
+        return response.text.strip()
+    
+    async def _run_tool(self, convo_id, block):
+        """Run a single tool_use block and return its tool_result block."""
+        self.send_update(convo_id, {"type": "tool_call", "name": block.name, "input": block.input})
+        result = {"type": "tool_result", "tool_use_id": block.id}
+        try:
+            if block.name == "get_weather":
+                result["content"] = await self.get_weather(**block.input)
+            else:
+                result["content"] = f"Unknown tool: {block.name}"
+                result["is_error"] = True
+        except Exception as e:
+            # Let Claude see the failure rather than failing the whole turn
+            result["content"] = f"Error: {e}"
+            result["is_error"] = True
+        self.send_update(convo_id, {"type": "tool_result", "name": block.name, "result": result["content"]})
+        if self.verbose:
+            print(f"🔧 {block.name}({block.input}) -> {result['content']}")
+        return result
+    
+    async def _run_tools(self, convo_id, content):
+        """Run every tool_use block in a response concurrently and return the tool_result blocks."""
+        _turn_used_tools.set(True)
+        return list(await asyncio.gather(*(
+            self._run_tool(convo_id, block) for block in content if block.type == "tool_use"
+        )))
     
-    def _handle_message(self, convo_id, message):
+    def _should_cache(self, convo_id, message, response):
+        # Tool-use turns depend on live tool results, so they are never cached
+        return not _turn_used_tools.get()
+    
+    async def _handle_message(self, convo_id, message, conversation):
         """Process the message and generate a response using Anthropic."""
-        # Get conversation history
-        anthropic_messages = format_anthropic_messages(self.message_store.get_conversation(convo_id).messages)
+        _turn_used_tools.set(False)
+        # Get conversation history. Tool calls and results only live for this
+        # turn, so they go on a copy rather than the cached history.
+        anthropic_messages = build_messages(self._anthropic_messages(conversation))
+        
+        # Send to Anthropic, answering tool calls until Claude replies with text
+        round_texts = []
+        for _ in range(MAX_TOOL_ROUNDS):
+            response = await self.call_llm(create_message, anthropic_messages, tools=self.tools)
+            # Keep the text of every round (e.g. "Let me check..." before a
+            # tool call), which is what _stream_message sends as well
+            round_texts.append("".join(block.text for block in response.content if block.type == "text"))
+            if response.stop_reason != "tool_use":
+                break
+            anthropic_messages.append({"role": "assistant", "content": response.content})
+            anthropic_messages.append({"role": "user", "content": await self._run_tools(convo_id, response.content)})
         
-        # Send to Anthropic
-        response = create_message(anthropic_messages)
+        return ROUND_SEPARATOR.join(text for text in round_texts if text)
+    
+    async def _stream_message(self, convo_id, message, conversation):
+        """Stream the response from Anthropic as it is generated."""
+        _turn_used_tools.set(False)
+        anthropic_messages = build_messages(self._anthropic_messages(conversation))
+        sent_text = False
+        for _ in range(MAX_TOOL_ROUNDS):
+            # Separate this round's text from earlier rounds' the same way
+            # _handle_message does, so both paths store the same reply
+            separate = sent_text
+            # Streams count against the same concurrency limit as call_llm
+            # until they finish, and rate-limited opens are retried
+            async with self.llm_stream(stream_message, anthropic_messages, tools=self.tools) as stream:
+                async for text in stream.text_stream:
+                    if not text:
+                        continue
+                    if separate:
+                        yield ROUND_SEPARATOR
+                        separate = False
+                    sent_text = True
+                    yield text
+                response = await stream.get_final_message()
+            if response.stop_reason != "tool_use":
+                break
+            anthropic_messages.append({"role": "assistant", "content": response.content})
+            anthropic_messages.append({"role": "user", "content": await self._run_tools(convo_id, response.content)})
+
+def make_agent(tools=True, weather_mock=True, cache=None, save_dir='./convos', verbose=True):
+    """
+    Create a Claude agent.
+    
+    Args:
+        tools: Whether to offer the tool definitions to Claude
+        weather_mock: Whether get_weather returns canned data instead of a live lookup
+        cache: Response cache type ("exact" or None; see BaseAgent)
+        save_dir: Directory where conversations should be saved
+        verbose: Whether to print diagnostic information
         
-        # Extract just the text content
-        return response.content[0].text
+    Returns:
+        A SimpleAgent instance
+    """
+    return SimpleAgent(tools=tools, weather_mock=weather_mock, cache=cache, save_dir=save_dir, verbose=verbose)
+
 
 if __name__ == "__main__":
-    agent = SimpleAgent()
-    agent.run(dev_mode=True, api_port=4000, port=3000)
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Run the Claude agent")
+    parser.add_argument("--prod", action="store_true", help="Run in production mode with a single server")
+    parser.add_argument("--no-tools", action="store_true", help="Don't offer tool definitions to Claude")
+    parser.add_argument("--live-weather", action="store_true", help="Look up real weather instead of the mock")
+    parser.add_argument("--port", type=int, default=3000, help="Port for the main server")
+    parser.add_argument("--api-port", type=int, default=4000, help="Port for the API server (only used in dev mode)")
+    args = parser.parse_args()
+    
+    agent = make_agent(tools=not args.no_tools, weather_mock=not args.live_weather)
+    
+    if args.prod:
+        agent.run(port=args.port)
+    else:
+        agent.run(dev_mode=True, api_port=args.api_port, port=args.port)
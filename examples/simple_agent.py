@@ -1,38 +1,140 @@
+import asyncio
+import importlib.util
+
+import httpx
+import orjson
 from aral.agent import BaseAgent
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
 import dotenv
 dotenv.load_dotenv()
 
-client = OpenAI()
+# Async client, so many conversations can wait on OpenAI at once without
+# tying up the server. It holds one connection pool for the whole process,
+# with enough keep-alive connections that concurrent turns reuse warm TCP+TLS
+# sessions; HTTP/2 multiplexing is used when the optional h2 package is installed.
+client = AsyncOpenAI(
+    http_client=DefaultAsyncHttpxClient(
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(max_keepalive_connections=50, max_connections=100, keepalive_expiry=120),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    )
+)
+
+MODEL = "gpt-4o"
+# Batch states after which polling stops
+BATCH_TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
 
 class SimpleAgent(BaseAgent):
     def init(self):
         # Any additional initialization can go here
         pass
     
-    def on_message(self, convo_id, message):
-        # Add the user message to the store
-        self.message_store.add_message(convo_id, message, role="user")
-        
-        # Generate a response using OpenAI if available, otherwise use a simple echo
-        openai_messages = [
-            {'role': m.role, 'content': m.content}
-            for m in self.message_store.get_conversation(convo_id).messages
-        ]
-        response = client.chat.completions.create(
-            model="gpt-4o",
+    async def _handle_message(self, convo_id, message, conversation):
+        # The conversation already holds the user message added by on_message
+        # Generate a response using OpenAI
+        openai_messages = conversation.as_openai_messages()
+        # call_llm caps concurrent requests and retries rate limits
+        response = await self.call_llm(
+            client.chat.completions.create,
+            model=MODEL,
             messages=openai_messages
         )
         # Extract the actual message content from the ChatCompletion response
         response_text = response.choices[0].message.content
 
-        # Add the assistant response to the store and return it
-        self.message_store.add_message(convo_id, response_text, role="assistant")
-
-        print(self.message_store.get_conversation(convo_id))
-        # Return just the response text instead of the entire ChatCompletion object
+        # Formatting the whole conversation is expensive, so only do it when asked
+        if self.verbose:
+            print(conversation)
+        # Return just the response text; on_message stores it as the assistant reply
         return response_text
+    
+    async def _stream_message(self, convo_id, message, conversation):
+        # Stream tokens as they are generated, so the UI shows the reply
+        # right away instead of after the whole completion. The stream
+        # counts against call_llm's concurrency limit until it finishes.
+        async with self.llm_stream(
+            client.chat.completions.create,
+            model=MODEL,
+            messages=conversation.as_openai_messages(),
+            stream=True,
+            stream_options={"include_usage": True}
+        ) as stream:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                # The final chunk carries token usage instead of a delta
+                if chunk.usage and self.verbose:
+                    print(f"Tokens: {chunk.usage.prompt_tokens} prompt, {chunk.usage.completion_tokens} completion")
+    
+    async def run_batch(self, items, poll_interval=5, max_poll_interval=60):
+        """
+        Answer many messages offline with the OpenAI Batch API, which costs
+        half as much as regular requests and doesn't count against their
+        rate limits. Suited to evals and backfills rather than live chat:
+        results can take up to 24 hours.
+        
+        A message and its response are only stored once the response comes
+        back, so a failed upload, batch or request leaves its conversation
+        unchanged and the message can simply be sent again.
+        
+        Args:
+            items: (conversation ID, message) pairs, at most one per conversation
+            poll_interval: Seconds to wait before first checking on the batch
+            max_poll_interval: Longest wait between checks (the wait doubles each time)
+            
+        Returns:
+            dict: Response text per conversation ID, or None where the request failed
+        """
+        convo_ids = [convo_id for convo_id, _ in items]
+        if len(set(convo_ids)) != len(convo_ids):
+            raise ValueError("run_batch takes at most one message per conversation")
+        
+        # Build one request per conversation: its history plus the new message
+        requests = []
+        for convo_id, message in items:
+            conversation = self.message_store.get_conversation(convo_id)
+            history = conversation.as_openai_messages() if conversation is not None else []
+            requests.append(orjson.dumps({
+                "custom_id": convo_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {"model": MODEL, "messages": history + [{"role": "user", "content": message}]},
+            }))
+        
+        input_file = await client.files.create(file=("batch.jsonl", b"\n".join(requests)), purpose="batch")
+        batch = await client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        if self.verbose:
+            print(f"📦 Submitted batch {batch.id} with {len(requests)} requests")
+        
+        # Poll with exponential backoff until the batch finishes
+        delay = poll_interval
+        while batch.status not in BATCH_TERMINAL_STATES:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_poll_interval)
+            batch = await client.batches.retrieve(batch.id)
+        if batch.status != "completed":
+            raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}")
+        
+        messages = dict(items)
+        results = dict.fromkeys(convo_ids)
+        if batch.output_file_id:
+            output = await client.files.content(batch.output_file_id)
+            for line in output.content.splitlines():
+                result = orjson.loads(line)
+                response = result.get("response") or {}
+                if response.get("status_code") != 200:
+                    continue
+                convo_id = result["custom_id"]
+                response_text = response["body"]["choices"][0]["message"]["content"]
+                self.message_store.add_message(convo_id, messages[convo_id], role="user")
+                self.message_store.add_message(convo_id, response_text, role="assistant")
+                results[convo_id] = response_text
+        return results
 
 
 if __name__ == "__main__":
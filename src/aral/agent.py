@@ -1,34 +1,121 @@
 import os
+import asyncio
+import hashlib
+import random
+import functools
+import collections
+import contextlib
+import inspect
+import weakref
 from pathlib import Path
-from .ui.server import UIServer
-from .ui.build import build_frontend, ensure_deps
+import orjson
 from .storage import MessageStore
+from .cache import SemanticCache
 import subprocess
-import threading
+
+def _retry_after(error):
+    """Seconds to wait from a rate limit error's Retry-After header, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def _accepts_conversation(method):
+    """Whether a handler method declares a `conversation` parameter."""
+    return "conversation" in inspect.signature(method).parameters
 
 class BaseAgent:
-    def __init__(self, message_store=None, save_dir=None, verbose=False):
+    # UI updates sent within this many seconds of each other go out as one batch
+    UPDATE_BATCH_INTERVAL = 0.01
+    # ...up to this many updates per batch
+    UPDATE_BATCH_MAX = 16
+    # Updates to buffer per conversation before dropping progress updates
+    UPDATE_QUEUE_SIZE = 1024
+    # High-rate update types that may be dropped when a subscriber falls behind;
+    # anything else (e.g. tool_call, tool_result) is always delivered
+    DROPPABLE_UPDATE_TYPES = {"progress_update", "token"}
+    # Backoff before the first retry of a rate-limited LLM call, doubling each attempt
+    LLM_RETRY_BASE_DELAY = 1.0
+    LLM_RETRY_MAX_DELAY = 30.0
+    # Earlier messages included with the user message in a semantic cache query
+    CACHE_CONTEXT_MESSAGES = 4
+    
+    def __init__(self, message_store=None, save_dir=None, verbose=False,
+                 coalesce_window=0, coalesce_max_messages=8,
+                 max_llm_concurrency=16, llm_max_retries=3,
+                 cache=None, cache_embed=None, cache_threshold=0.95,
+                 flush_interval=0):
         """Initialize the agent with a MessageStore.
         
         Args:
             message_store: Optional custom MessageStore instance
             save_dir: Directory where conversations should be saved
             verbose: Whether to print diagnostic information
+            coalesce_window: Seconds to wait for more messages in the same
+                conversation before handling them as one turn (0 disables
+                coalescing). The messages of a turn are stored as a single
+                user message, so handlers see the same text in ``message``
+                and in the conversation history. Leave disabled for agents
+                that use tool calls.
+            coalesce_max_messages: Handle a coalesced batch as soon as it
+                reaches this many messages
+            max_llm_concurrency: Maximum number of call_llm calls in flight
+                at once, across all conversations
+            llm_max_retries: How many times call_llm retries a rate-limited call
+            cache: Reply to repeated messages from a response cache instead of
+                calling the handler: "exact" matches messages that are
+                identical up to case and whitespace, "semantic" also matches
+                paraphrases using cache_embed, and None disables caching.
+                Either way a reply is only reused for a message that follows
+                the same conversation history.
+            cache_embed: Function mapping text to an embedding vector
+                (required for cache="semantic"). It is run in a worker thread.
+            cache_threshold: Minimum cosine similarity for a semantic cache hit
+            flush_interval: If set, the store created for save_dir writes new
+                messages from a background thread every flush_interval
+                seconds instead of on the event loop as each one is added
         """
         self.verbose = verbose
-        self.initial_cwd = os.getcwd()  # Store the initial working directory
+        self.coalesce_window = coalesce_window
+        self.coalesce_max_messages = coalesce_max_messages
+        # Messages waiting to be coalesced, keyed by conversation ID
+        self._pending_batches = {}
+        # Strong references to running batch tasks so they aren't garbage collected
+        self._batch_tasks = set()
+        # (event loop, pending updates, asyncio.Event) of each UI subscribed
+        # to a conversation's updates. The tuples are replaced rather than
+        # mutated, so send_update can read them from any thread.
+        self._update_queues = {}
+        # Caps concurrent provider calls so bursts don't trip rate limits. The
+        # semaphores are created lazily, one per event loop (see _llm_semaphore)
+        self.max_llm_concurrency = max_llm_concurrency
+        self._llm_semaphores = weakref.WeakKeyDictionary()
+        self.llm_max_retries = llm_max_retries
+        
+        # Set up the response cache
+        if cache == "semantic":
+            if cache_embed is None:
+                raise ValueError("cache_embed must be provided when cache is 'semantic'")
+            self.response_cache = SemanticCache(embed=cache_embed, threshold=cache_threshold)
+        elif cache == "exact":
+            self.response_cache = SemanticCache()
+        elif cache is None:
+            self.response_cache = None
+        else:
+            raise ValueError(f"Unknown cache type: {cache!r}")
         
         # Initialize message store
         if message_store:
             self.message_store = message_store
         elif save_dir:
-            self.message_store = MessageStore(save_dir=save_dir)
+            self.message_store = MessageStore(save_dir=save_dir, flush_interval=flush_interval)
         else:
             self.message_store = MessageStore()
             
         if self.verbose:
             print(f"Initializing agent with MessageStore {'with persistence' if save_dir else 'in memory only'}")
-            print(f"Initial working directory: {self.initial_cwd}")
             
             if hasattr(self.message_store, 'backend') and hasattr(self.message_store.backend, 'list_conversation_ids'):
                 conversation_ids = self.message_store.backend.list_conversation_ids()
@@ -36,6 +123,11 @@ class BaseAgent:
                 
         # Call the init method for any additional initialization
         self.init()
+        
+        # Handlers that declare a `conversation` parameter are passed the
+        # Conversation, so they don't have to look it up again
+        self._handler_takes_conversation = _accepts_conversation(self._handle_message)
+        self._stream_takes_conversation = _accepts_conversation(self._stream_message)
     
     def init(self):
         """Override this method to initialize your agent."""
@@ -46,6 +138,14 @@ class BaseAgent:
         Internal method that handles the actual message processing.
         Override this in your subclass instead of on_message.
         
+        May be defined as a regular method or as a coroutine (``async def``).
+        Regular methods are run in a worker thread so that blocking calls
+        (e.g. a synchronous LLM client) don't stall the server's event loop.
+        
+        To get the Conversation (which already holds the user message)
+        without looking it up in the store, add a ``conversation`` parameter:
+        ``def _handle_message(self, convo_id, message, conversation)``.
+        
         Args:
             convo_id: The conversation ID
             message: The message content
@@ -56,11 +156,124 @@ class BaseAgent:
         # Default implementation just echoes the message
         return f"Echo: {message}"
     
-    def on_message(self, convo_id, message):
+    def _conversation_kwargs(self, convo_id, wanted):
+        """Keyword arguments passing the conversation to a handler that accepts it."""
+        if not wanted:
+            return {}
+        return {"conversation": self.message_store.get_conversation(convo_id)}
+    
+    async def _call_handler(self, convo_id, message):
+        """Invoke _handle_message, offloading synchronous handlers to a thread."""
+        kwargs = self._conversation_kwargs(convo_id, self._handler_takes_conversation)
+        if inspect.iscoroutinefunction(self._handle_message):
+            return await self._handle_message(convo_id, message, **kwargs)
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self._handle_message, convo_id, message, **kwargs)
+        )
+    
+    @property
+    def _llm_semaphore(self):
+        """
+        The semaphore capping concurrent LLM calls on the running event loop.
+        
+        An asyncio.Semaphore can only be used from one loop (on Python < 3.10
+        the one current when it was created), so one is created on first use
+        in each loop rather than in __init__, which may run outside any loop.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._llm_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._llm_semaphores[loop] = asyncio.Semaphore(self.max_llm_concurrency)
+        return semaphore
+    
+    def _rate_limit_delay(self, error, attempt):
+        """Seconds to wait before retrying a failed LLM call, or None if it shouldn't be retried."""
+        if getattr(error, "status_code", None) != 429 or attempt == self.llm_max_retries:
+            return None
+        delay = _retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.LLM_RETRY_MAX_DELAY, self.LLM_RETRY_BASE_DELAY * 2 ** attempt))
+        if self.verbose:
+            print(f"⏳ Rate limited, retrying in {delay:.1f}s ({attempt + 1}/{self.llm_max_retries})")
+        return delay
+    
+    async def call_llm(self, create, *args, **kwargs):
+        """
+        Call an LLM provider, limiting concurrency and retrying rate limits.
+        
+        At most max_llm_concurrency calls run at once. Calls that fail with
+        HTTP 429 (e.g. openai.RateLimitError or anthropic.RateLimitError) are
+        retried with jittered exponential backoff, honouring the provider's
+        Retry-After header when it sends one.
+        
+        Args:
+            create: Async function making the request, e.g.
+                client.chat.completions.create
+            *args, **kwargs: Arguments passed to create
+            
+        Returns:
+            The result of create
+        """
+        for attempt in range(self.llm_max_retries + 1):
+            try:
+                async with self._llm_semaphore:
+                    return await create(*args, **kwargs)
+            except Exception as e:
+                delay = self._rate_limit_delay(e, attempt)
+                if delay is None:
+                    raise
+            # Back off outside the semaphore so other calls can proceed meanwhile
+            await asyncio.sleep(delay)
+    
+    @contextlib.asynccontextmanager
+    async def llm_stream(self, create, *args, **kwargs):
+        """
+        Open a streaming LLM call, limiting concurrency and retrying rate limits.
+        
+        The streaming counterpart of call_llm: opening the stream is retried
+        like a call_llm call, and the stream counts against
+        max_llm_concurrency until the ``async with`` block exits, e.g.::
+        
+            async with self.llm_stream(client.messages.stream, **params) as stream:
+                async for text in stream.text_stream:
+                    yield text
+        
+        Args:
+            create: Function opening the stream. It may return the stream, an
+                awaitable of it (e.g. client.chat.completions.create with
+                stream=True) or an async context manager entering it (e.g.
+                anthropic's client.messages.stream)
+            *args, **kwargs: Arguments passed to create
+            
+        Yields:
+            The open stream, which is closed when the block exits
+        """
+        for attempt in range(self.llm_max_retries + 1):
+            async with self._llm_semaphore, contextlib.AsyncExitStack() as stack:
+                try:
+                    stream = create(*args, **kwargs)
+                    if inspect.isawaitable(stream):
+                        stream = await stream
+                    if hasattr(stream, "__aexit__"):
+                        stream = await stack.enter_async_context(stream)
+                except Exception as e:
+                    delay = self._rate_limit_delay(e, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    yield stream
+                    return
+            # Back off outside the semaphore so other calls can proceed meanwhile
+            await asyncio.sleep(delay)
+    
+    async def on_message(self, convo_id, message):
         """
         Handle an incoming message. This method:
         1. Logs the incoming message if verbose mode is on
-        2. Adds the user message to the store
+        2. Adds the user message to the store (with coalescing, once the
+           batch it belongs to is handled, combined with the rest of it)
         3. Calls the _handle_message method for custom processing
         4. Adds the response to the store
         5. Returns the response
@@ -78,24 +291,322 @@ class BaseAgent:
         if self.verbose:
             print(f"\n==== Received message in conversation {convo_id} ====")
             print(f"Message: {message}")
-            print(f"Current working directory: {os.getcwd()}")
+        
+        if self.coalesce_window:
+            # The batch handler adds the (combined) user message and the
+            # shared response to the store, and checks the response cache
+            response = await self._coalesce(convo_id, message)
+        else:
+            # Add the user message to the store
+            self.message_store.add_message(convo_id, message, role="user")
+            
+            cache_query, cached = await self._cached_response(convo_id, message)
+            if cached is not None:
+                response = cached
+                self.message_store.add_message(convo_id, response, role="assistant")
+            else:
+                # Call the handler method for custom processing
+                response = await self._call_handler(convo_id, message)
+                
+                # Add the assistant response to the store
+                self.message_store.add_message(convo_id, response, role="assistant")
+                self._cache_response(convo_id, message, response, cache_query)
+        
+        if self.verbose:
+            print(f"Response: {response[:50]}{'...' if len(response) > 50 else ''}")
+            if hasattr(self.message_store, 'backend') and hasattr(self.message_store.backend, 'list_conversation_ids'):
+                conversation_ids = self.message_store.backend.list_conversation_ids()
+                print(f"Active conversations: {conversation_ids}")
+        
+        return response
+    
+    async def _stream_message(self, convo_id, message):
+        """
+        Internal async generator that streams the response as text chunks.
+        Override this in your subclass to stream tokens from your model.
+        
+        The default implementation yields the whole response of
+        _handle_message as a single chunk.
+        
+        Like _handle_message, it is passed the Conversation if it declares
+        a ``conversation`` parameter.
+        
+        Args:
+            convo_id: The conversation ID
+            message: The message content
+            
+        Yields:
+            Chunks of the response message content
+        """
+        yield await self._call_handler(convo_id, message)
+    
+    async def on_message_stream(self, convo_id, message):
+        """
+        Handle an incoming message, yielding the response as it is generated.
+        The user message is stored first and the assembled response is stored
+        once the stream completes.
+        
+        Do NOT override this method in your subclass.
+        Override _stream_message instead.
+        
+        Args:
+            convo_id: The conversation ID
+            message: The message content
+            
+        Yields:
+            Chunks of the response message content
+        """
+        if self.verbose:
+            print(f"\n==== Received message in conversation {convo_id} (streaming) ====")
+            print(f"Message: {message}")
         
         # Add the user message to the store
         self.message_store.add_message(convo_id, message, role="user")
         
-        # Call the handler method for custom processing
-        response = self._handle_message(convo_id, message)
+        cache_query, cached = await self._cached_response(convo_id, message)
+        if cached is not None:
+            yield cached
+            self.message_store.add_message(convo_id, cached, role="assistant")
+            return
+        
+        chunks = []
+        kwargs = self._conversation_kwargs(convo_id, self._stream_takes_conversation)
+        async for chunk in self._stream_message(convo_id, message, **kwargs):
+            chunks.append(chunk)
+            yield chunk
         
-        # Add the assistant response to the store
+        # Add the assembled assistant response to the store
+        response = "".join(chunks)
         self.message_store.add_message(convo_id, response, role="assistant")
+        self._cache_response(convo_id, message, response, cache_query)
         
         if self.verbose:
             print(f"Response: {response[:50]}{'...' if len(response) > 50 else ''}")
-            if hasattr(self.message_store, 'backend') and hasattr(self.message_store.backend, 'list_conversation_ids'):
-                conversation_ids = self.message_store.backend.list_conversation_ids()
-                print(f"Active conversations: {conversation_ids}")
+    
+    def _should_cache(self, convo_id, message, response):
+        """
+        Decide whether a response may be served again for similar messages.
+        Override this to exclude responses that depend on live data, such as
+        turns that called a tool.
         
-        return response
+        Args:
+            convo_id: The conversation ID
+            message: The message content
+            response: The response message content
+            
+        Returns:
+            True if the response should be cached
+        """
+        return True
+    
+    async def _cache_query(self, convo_id, message):
+        """
+        Build the response cache query for a user message that was just
+        added to its conversation.
+        
+        The query is scoped to a digest of the conversation history before
+        the message, since that is what the reply depends on: the same
+        message after a different history (e.g. "yes" or "why?") never
+        reuses a reply, and neither does another conversation unless its
+        history is identical. For semantic matching the message is embedded
+        together with the last few messages before it, in a worker thread
+        so a slow embedding backend can't stall the event loop.
+        
+        Args:
+            convo_id: The conversation ID
+            message: The message content
+            
+        Returns:
+            tuple: (prompt, scope, vector) to pass to the response cache
+        """
+        conversation = self.message_store.get_conversation(convo_id)
+        history = conversation.messages[:-1] if conversation is not None else []
+        digest = hashlib.blake2b(digest_size=16)
+        for m in history:
+            digest.update(orjson.dumps([m.role, m.content]))
+        
+        context = history[-self.CACHE_CONTEXT_MESSAGES:] if self.CACHE_CONTEXT_MESSAGES else []
+        prompt = "\n".join([f"{m.role}: {m.content}" for m in context] + [f"user: {message}"])
+        vector = None
+        if self.response_cache.embed is not None:
+            loop = asyncio.get_running_loop()
+            vector = await loop.run_in_executor(None, self.response_cache.embed_prompt, prompt)
+        return prompt, digest.digest(), vector
+    
+    async def _cached_response(self, convo_id, message):
+        """
+        Look a user message up in the response cache.
+        
+        Returns:
+            tuple: (query, response), where query is passed on to
+            _cache_response (None with caching off) and response is the
+            cached response, or None on a miss
+        """
+        if self.response_cache is None:
+            return None, None
+        query = await self._cache_query(convo_id, message)
+        prompt, scope, vector = query
+        response = self.response_cache.get(prompt, scope=scope, vector=vector)
+        if response is not None and self.verbose:
+            print("⚡ Response cache hit")
+        return query, response
+    
+    def _cache_response(self, convo_id, message, response, query):
+        if query is not None and self._should_cache(convo_id, message, response):
+            prompt, scope, vector = query
+            self.response_cache.put(prompt, response, scope=scope, vector=vector)
+    
+    async def _coalesce(self, convo_id, message):
+        """
+        Queue a message to be handled together with any others that arrive in
+        the same conversation within coalesce_window seconds, and wait for the
+        shared response.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        
+        batch = self._pending_batches.get(convo_id)
+        if batch is None:
+            batch = self._pending_batches[convo_id] = []
+            loop.call_later(self.coalesce_window, self._flush_batch, convo_id, batch)
+        batch.append((message, future))
+        
+        if len(batch) >= self.coalesce_max_messages:
+            self._flush_batch(convo_id, batch)
+        
+        return await future
+    
+    def _flush_batch(self, convo_id, batch):
+        """Handle a batch of coalesced messages, unless it was already flushed."""
+        if self._pending_batches.get(convo_id) is not batch:
+            return
+        del self._pending_batches[convo_id]
+        task = asyncio.ensure_future(self._handle_batch(convo_id, batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+    
+    async def _handle_batch(self, convo_id, batch):
+        """
+        Store a batch as one user message, answer it from the response cache
+        or by running the handler once, and resolve every waiting message
+        with the response.
+        
+        Storing the combined message (rather than each message as it
+        arrived) means handlers that build their prompt from the
+        conversation history see the same turn as ``message``.
+        """
+        if len(batch) == 1:
+            message = batch[0][0]
+        else:
+            message = "The user sent these messages in quick succession:\n" + "\n".join(
+                f"- {message}" for message, _ in batch
+            )
+        
+        try:
+            self.message_store.add_message(convo_id, message, role="user")
+            # The cache is checked for the batch as a whole, once it is stored
+            cache_query, response = await self._cached_response(convo_id, message)
+            if response is None:
+                response = await self._call_handler(convo_id, message)
+                self.message_store.add_message(convo_id, response, role="assistant")
+                self._cache_response(convo_id, message, response, cache_query)
+            else:
+                self.message_store.add_message(convo_id, response, role="assistant")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for _, future in batch:
+            if not future.done():
+                future.set_result(response)
+    
+    def send_update(self, convo_id, update):
+        """
+        Send a UI update (e.g. tool progress) for a conversation.
+        
+        Updates are queued and delivered in batches to every UI subscribed to
+        the conversation, and dropped if there are none. Safe to call from
+        both async handlers and synchronous handlers running in a worker thread.
+        
+        Args:
+            convo_id: The conversation ID
+            update: A JSON-serializable dict describing the update
+        """
+        subscriptions = self._update_queues.get(convo_id)
+        if not subscriptions:
+            return
+        # Encode once, here, for every subscriber; batches are spliced from
+        # these bytes without re-encoding
+        entry = (update.get("type"), update.get("id"), orjson.dumps(update))
+        for subscription in subscriptions:
+            subscription[0].call_soon_threadsafe(self._enqueue_update, subscription, entry)
+    
+    def _enqueue_update(self, subscription, entry):
+        """Queue an encoded update for a subscriber, making room if it has fallen behind."""
+        _, pending, ready = subscription
+        update_type, update_id, _ = entry
+        droppable = update_type in self.DROPPABLE_UPDATE_TYPES
+        if droppable and update_id is not None:
+            # A newer progress update for the same operation supersedes one still waiting
+            for i in range(len(pending) - 1, -1, -1):
+                if pending[i][0] == update_type and pending[i][1] == update_id:
+                    pending[i] = entry
+                    return
+        if len(pending) >= self.UPDATE_QUEUE_SIZE:
+            # Drop the oldest progress update rather than anything the UI must see
+            for i, queued in enumerate(pending):
+                if queued[0] in self.DROPPABLE_UPDATE_TYPES:
+                    del pending[i]
+                    break
+            else:
+                if droppable:
+                    return
+        pending.append(entry)
+        ready.set()
+    
+    async def updates(self, convo_id):
+        """
+        Subscribe to the updates sent for a conversation.
+        
+        Updates sent within UPDATE_BATCH_INTERVAL of each other are yielded
+        together, so the UI receives one frame rather than one per update.
+        Each update is encoded once by send_update and batches are joined
+        from those bytes.
+        Senders never wait on the subscriber: if it falls more than
+        UPDATE_QUEUE_SIZE updates behind, the oldest updates of a
+        DROPPABLE_UPDATE_TYPES type are discarded. An update of such a type
+        with an "id" replaces an undelivered one with the same type and id.
+        A conversation can have any number of subscribers (e.g. several
+        open tabs); each gets every update, with its own queue.
+        
+        Args:
+            convo_id: The conversation ID
+            
+        Yields:
+            bytes: A JSON array of updates, in the order they were sent
+        """
+        pending = collections.deque()
+        ready = asyncio.Event()
+        subscription = (asyncio.get_running_loop(), pending, ready)
+        self._update_queues[convo_id] = self._update_queues.get(convo_id, ()) + (subscription,)
+        try:
+            while True:
+                await ready.wait()
+                # Give closely spaced updates a moment to arrive and join this batch
+                if len(pending) < self.UPDATE_BATCH_MAX:
+                    await asyncio.sleep(self.UPDATE_BATCH_INTERVAL)
+                batch = [pending.popleft()[2] for _ in range(min(self.UPDATE_BATCH_MAX, len(pending)))]
+                if not pending:
+                    ready.clear()
+                yield b"[" + b",".join(batch) + b"]"
+        finally:
+            remaining = tuple(s for s in self._update_queues.get(convo_id, ()) if s is not subscription)
+            if remaining:
+                self._update_queues[convo_id] = remaining
+            else:
+                self._update_queues.pop(convo_id, None)
     
     def get_conversations(self):
         """
@@ -122,6 +633,43 @@ class BaseAgent:
             for conv in conversations
         ]
     
+    def iter_conversations_json(self, chunk_size=65536):
+        """
+        Generate the JSON body of the UI's conversations response in chunks,
+        so it can be streamed without building the whole body in memory.
+        Each conversation's encoding is cached, so only conversations that
+        changed since the last call are serialized.
+        
+        Args:
+            chunk_size: Approximate number of bytes per chunk
+            
+        Yields:
+            bytes: Consecutive pieces of ``{"conversations": [...]}``
+        """
+        chunk = [b'{"conversations":[']
+        size = 0
+        for i, conv in enumerate(self.message_store.get_all_conversations()):
+            if i:
+                chunk.append(b",")
+            encoded = conv.to_ui_json()
+            chunk.append(encoded)
+            size += len(encoded)
+            if size >= chunk_size:
+                yield b"".join(chunk)
+                chunk = []
+                size = 0
+        chunk.append(b"]}")
+        yield b"".join(chunk)
+    
+    def get_conversations_json(self):
+        """
+        Get all conversations as the JSON body of the UI's conversations response.
+        
+        Returns:
+            bytes: ``{"conversations": [...]}`` encoded as JSON
+        """
+        return b"".join(self.iter_conversations_json())
+    
     def run(self, host="0.0.0.0", port=3000, api_port=None, dev_mode=False, auto_build=True):
         """
         Run the agent with a web UI
@@ -133,6 +681,12 @@ class BaseAgent:
             dev_mode: If True, run the Next.js frontend in dev mode with hot reloading
             auto_build: Whether to automatically build the UI if not already built
         """
+        # Imported here rather than at module level: FastAPI accounts for most
+        # of the import time of this package, and agents used without the UI
+        # (scripts, tests, batch jobs) never need it
+        from .ui.server import UIServer
+        from .ui.build import build_frontend, ensure_deps, dev_server_command
+        
         frontend_dir = Path(__file__).parent / "ui" / "frontend"
         ui_dir = frontend_dir / "out"
         
@@ -148,34 +702,33 @@ class BaseAgent:
 
             print(f"Running frontend at {frontend_dir}")
             
-            # Start the Next.js dev server in a separate thread
-            def run_frontend_dev():
-                current_dir = os.getcwd()
+            # Start the Next.js dev server as a child process in the frontend
+            # directory; it runs alongside the API server and is stopped with it
+            frontend_process = None
+            command = dev_server_command(port)
+            if command is None:
+                print("❌ Cannot run dev server: please install bun, pnpm or npm.")
+            elif not ensure_deps(frontend_dir):
+                print("❌ Cannot run dev server without dependencies.")
+            else:
+                # Set environment variable for the API URL
+                env = os.environ.copy()
+                env["NEXT_PUBLIC_API_URL"] = api_url
                 try:
-                    os.chdir(frontend_dir)
-                    
-                    # Ensure dependencies are installed before running dev server
-                    if not ensure_deps(frontend_dir):
-                        print("❌ Cannot run dev server without dependencies.")
-                        return
-                    
-                    # Set environment variable for the API URL
-                    env = os.environ.copy()
-                    env["NEXT_PUBLIC_API_URL"] = api_url
-                    # Run the Next.js dev server
-                    subprocess.run(["bun", "run", "dev", "--port", str(port)], env=env)
-                except Exception as e:
+                    frontend_process = subprocess.Popen(command, cwd=str(frontend_dir), env=env)
+                except OSError as e:
                     print(f"Error running frontend dev server: {e}")
-                finally:
-                    os.chdir(current_dir)
-            
-            # Start the frontend in a separate thread
-            frontend_thread = threading.Thread(target=run_frontend_dev)
-            frontend_thread.daemon = True
-            frontend_thread.start()
             
             # Run the API server (this will block)
-            server.run(host=host, port=api_port)
+            try:
+                server.run(host=host, port=api_port)
+            finally:
+                if frontend_process is not None and frontend_process.poll() is None:
+                    frontend_process.terminate()
+                    try:
+                        frontend_process.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        frontend_process.kill()
         else:
             # Regular mode - check if UI is built
             if auto_build and not ui_dir.exists():
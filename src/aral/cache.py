@@ -0,0 +1,131 @@
+import math
+import operator
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional, Sequence, Tuple
+
+
+def _normalize_text(text: str) -> str:
+    """Normalize a prompt so trivially different spellings share a cache key."""
+    return " ".join(text.lower().split())
+
+
+def _unit_vector(vector: Sequence[float]) -> List[float]:
+    """Scale a vector to unit length so cosine similarity is a dot product."""
+    norm = math.sqrt(sum(x * x for x in vector))
+    if not norm:
+        return list(vector)
+    return [x / norm for x in vector]
+
+
+class SemanticCache:
+    """A bounded cache of responses keyed by prompt similarity.
+
+    Lookups first try an exact match on the normalized prompt text. If an
+    ``embed`` callable is provided, misses fall back to a cosine-similarity
+    search over the embeddings of cached prompts, returning the closest
+    response when its similarity is at least ``threshold``.
+
+    Without ``embed`` the cache only matches prompts that are identical after
+    lowercasing and collapsing whitespace.
+
+    Entries can be given a ``scope`` (any hashable, e.g. a digest of the
+    conversation so far). A lookup only matches entries cached under the
+    same scope, exactly or semantically.
+    """
+
+    def __init__(
+        self,
+        embed: Optional[Callable[[str], Sequence[float]]] = None,
+        threshold: float = 0.92,
+        max_entries: int = 1024
+    ):
+        """Initialize the cache.
+
+        Args:
+            embed: Optional function mapping a prompt to an embedding vector
+            threshold: Minimum cosine similarity for a semantic hit
+            max_entries: Maximum number of cached responses (LRU eviction)
+        """
+        self.embed = embed
+        self.threshold = threshold
+        self.max_entries = max_entries
+        # (scope, normalized prompt) -> (unit embedding or None, response)
+        self._entries: "OrderedDict[Tuple[Hashable, str], Tuple[Optional[List[float]], str]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def embed_prompt(self, prompt: str) -> Optional[List[float]]:
+        """Return the unit embedding of a prompt, or None without ``embed``.
+
+        get and put accept the result as ``vector``, so a caller can compute
+        it once per prompt (e.g. in a worker thread) and use it for both.
+        """
+        if self.embed is None:
+            return None
+        return _unit_vector(self.embed(prompt))
+
+    def get(
+        self,
+        prompt: str,
+        scope: Hashable = None,
+        vector: Optional[List[float]] = None
+    ) -> Optional[str]:
+        """Return a cached response for the prompt, or None on a miss.
+
+        Args:
+            prompt: The prompt to look up
+            scope: Only match entries cached under this scope
+            vector: The prompt's embedding from embed_prompt; computed here
+                if it is needed and not given
+        """
+        key = (scope, _normalize_text(prompt))
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        if self.embed is None or not self._entries:
+            return None
+
+        query = vector if vector is not None else self.embed_prompt(prompt)
+        best_key, best_score = None, self.threshold
+        for cached_key, (cached_vector, _) in self._entries.items():
+            if cached_vector is None or cached_key[0] != scope:
+                continue
+            score = sum(map(operator.mul, query, cached_vector))
+            if score >= best_score:
+                best_key, best_score = cached_key, score
+
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key][1]
+
+    def put(
+        self,
+        prompt: str,
+        response: str,
+        scope: Hashable = None,
+        vector: Optional[List[float]] = None
+    ) -> None:
+        """Cache a response for the prompt, evicting the least recently used entry.
+
+        Args:
+            prompt: The prompt the response answers
+            response: The response to cache
+            scope: The scope to cache it under
+            vector: The prompt's embedding from embed_prompt; computed here
+                if the cache is semantic and it is not given
+        """
+        key = (scope, _normalize_text(prompt))
+        if vector is None:
+            vector = self.embed_prompt(prompt)
+        self._entries[key] = (vector, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all cached responses."""
+        self._entries.clear()
@@ -1,17 +1,28 @@
-from typing import Dict, List, Optional, Any, Union, Literal
+from typing import Callable, Dict, List, Optional, Any, Union, Literal, Tuple
 from datetime import datetime
 import uuid
 import os
-import json
-import shutil
+import atexit
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from pydantic import BaseModel, Field
+import orjson
+from pydantic import BaseModel, Field, PrivateAttr
+
+from ..tokens import count_tokens
+
+
+def _new_id() -> str:
+    """Generate an opaque ID (a random UUID's 32 hex digits, without dashes)."""
+    return uuid.uuid4().hex
 
 
 class Message(BaseModel):
     """A message in a conversation."""
     
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=_new_id)
     content: str
     role: str = "user"
     created_at: datetime = Field(default_factory=datetime.now)
@@ -24,7 +35,7 @@ class Message(BaseModel):
 class ConversationAction(BaseModel):
     """An action performed in a conversation, such as a tool call or event."""
     
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=_new_id)
     action_type: str
     data: Dict[str, Any]
     created_at: datetime = Field(default_factory=datetime.now)
@@ -37,47 +48,185 @@ class ConversationAction(BaseModel):
 class Conversation(BaseModel):
     """A conversation between a user and an agent."""
     
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=_new_id)
     title: str = ""
     created_at: datetime = Field(default_factory=datetime.now)
     metadata: Dict[str, Any] = Field(default_factory=dict)
     messages: List[Message] = Field(default_factory=list)
     actions: List[ConversationAction] = Field(default_factory=list)
     
+    # OpenAI-format copy of messages, extended as messages are added
+    _openai_messages: Optional[List[Dict[str, str]]] = PrivateAttr(default=None)
+    # UI JSON encoding and the (message count, title) it was built from
+    _ui_json: Optional[bytes] = PrivateAttr(default=None)
+    _ui_json_key: Optional[tuple] = PrivateAttr(default=None)
+    # Token count of each message and their sum, and the counter that produced them
+    _token_counts: List[int] = PrivateAttr(default_factory=list)
+    _token_total: int = PrivateAttr(default=0)
+    _token_counter: Optional[Callable[[str], int]] = PrivateAttr(default=None)
+    
     class Config:
         arbitrary_types_allowed = True
     
     def __init__(self, **data):
         if "title" not in data or not data["title"]:
             # Generate a title based on ID if not provided
-            id_value = data.get("id", str(uuid.uuid4()))
+            id_value = data.setdefault("id", _new_id())
             data["title"] = f"Conversation {id_value[:8]}"
         super().__init__(**data)
     
+    @classmethod
+    def _from_stored_dict(cls, data: Dict[str, Any]) -> "Conversation":
+        """Build a conversation from its stored (model_dump or JSON) form.
+        
+        The whole tree, including ISO datetime strings, is validated in a
+        single pydantic-core call. This is faster than model_construct, which
+        builds each message in Python.
+        """
+        if not data.get("title"):
+            # Same default title as __init__, which model_validate bypasses
+            data = dict(data)
+            data["title"] = f"Conversation {data.setdefault('id', _new_id())[:8]}"
+        return cls.model_validate(data)
+    
     def add_message(self, message: Union[Message, Dict[str, Any]]) -> Message:
         """Add a message to the conversation."""
         if isinstance(message, dict):
-            message = Message(**message)
+            message = Message.model_validate(message)
         
         self.messages.append(message)
+        self._ui_json = None
+        if self._openai_messages is not None and len(self._openai_messages) == len(self.messages) - 1:
+            self._openai_messages.append({"role": message.role, "content": message.content})
         return message
     
+    def as_openai_messages(self) -> List[Dict[str, str]]:
+        """Get the messages as OpenAI chat messages (``{"role", "content"}`` dicts).
+        
+        The list is built once and then kept up to date as messages are
+        added, so each turn doesn't reformat the whole history. Treat it as
+        read-only; copy it before adding messages of your own.
+        """
+        cached = self._openai_messages
+        if cached is None or len(cached) > len(self.messages):
+            # First call, or messages were removed directly: rebuild
+            cached = self._openai_messages = []
+        if len(cached) < len(self.messages):
+            # Catch up on messages appended directly to self.messages
+            cached.extend(
+                {"role": m.role, "content": m.content}
+                for m in self.messages[len(cached):]
+            )
+        return cached
+    
+    def total_tokens(self, count: Optional[Callable[[str], int]] = None) -> int:
+        """Get the total number of tokens in the conversation's messages.
+        
+        Each message is counted once and the running total is kept, so
+        calling this every turn only tokenizes the messages added since the
+        last call.
+        
+        Args:
+            count: Function returning the number of tokens in a string
+                (defaults to aral.tokens.count_tokens)
+            
+        Returns:
+            int: The sum of the messages' token counts
+        """
+        if count is None:
+            count = count_tokens
+        counts = self._token_counts
+        if count is not self._token_counter or len(counts) > len(self.messages):
+            # Different tokenizer, or messages were removed directly: recount
+            counts = self._token_counts = []
+            self._token_total = 0
+            self._token_counter = count
+        for message in self.messages[len(counts):]:
+            tokens = count(message.content)
+            counts.append(tokens)
+            self._token_total += tokens
+        return self._token_total
+    
+    def to_ui_json(self) -> bytes:
+        """Get the conversation as the UI's JSON (id, title and messages), encoded with orjson.
+        
+        The encoding is cached until a message is added or the title changes,
+        so polling clients don't reserialize unchanged conversations.
+        """
+        key = (len(self.messages), self.title)
+        if self._ui_json is None or self._ui_json_key != key:
+            self._ui_json = orjson.dumps({
+                "id": self.id,
+                "title": self.title,
+                "messages": [
+                    {
+                        "id": msg.id,
+                        "content": msg.content,
+                        "role": msg.role,
+                        "created_at": msg.created_at,
+                    }
+                    for msg in self.messages
+                ]
+            })
+            self._ui_json_key = key
+        return self._ui_json
+    
     def add_action(self, action: Union[ConversationAction, Dict[str, Any]]) -> ConversationAction:
         """Add an action to the conversation."""
         if isinstance(action, dict):
-            action = ConversationAction(**action)
+            action = ConversationAction.model_validate(action)
         
         self.actions.append(action)
         return action
 
 
-class DateTimeEncoder(json.JSONEncoder):
-    """JSON encoder that handles datetime objects."""
-    
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super().default(obj)
+def _write_json(path: Path, data: Union[Dict[str, Any], BaseModel]) -> None:
+    """Atomically write data to path as compact JSON.
+    
+    Pydantic models are encoded directly by pydantic-core, without building
+    an intermediate dict; dicts are encoded with orjson. Both handle
+    datetimes natively. The payload is written to a temporary file in a
+    single call and fsync'ed before being moved into place. Each write gets
+    its own uniquely named temporary file, so concurrent writes to the same
+    path can't interleave.
+    """
+    if isinstance(data, BaseModel):
+        payload = data.model_dump_json().encode()
+    else:
+        payload = orjson.dumps(data)
+    
+    # Ensure temp file parent directory exists
+    path.parent.mkdir(exist_ok=True, parents=True)
+    fd, temp_file = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            # Make the new contents durable before they replace the old file, so
+            # a crash can't leave an empty or partial file under the real name
+            f.flush()
+            os.fsync(f.fileno())
+        
+        # Atomic replace: the temp file is in the same directory, so this is a
+        # single rename
+        os.replace(temp_file, path)
+    except BaseException:
+        try:
+            os.unlink(temp_file)
+        except OSError:
+            pass
+        raise
+
+
+def _record_count(conversation_data: Union[Dict[str, Any], BaseModel]) -> int:
+    """Number of messages plus actions in a conversation model or dict."""
+    if isinstance(conversation_data, BaseModel):
+        return len(conversation_data.messages) + len(conversation_data.actions)
+    return len(conversation_data.get("messages", [])) + len(conversation_data.get("actions", []))
+
+
+def _read_json(path: Path) -> Any:
+    """Read and parse a JSON file with orjson."""
+    return orjson.loads(path.read_bytes())
 
 
 class StorageBackend:
@@ -95,14 +244,46 @@ class StorageBackend:
         """Load the message store data."""
         pass
     
-    def save_conversation(self, conversation_id: str, conversation_data: Dict[str, Any]) -> None:
-        """Save a single conversation."""
+    def save_conversation(self, conversation_id: str, conversation_data: Union[Dict[str, Any], BaseModel]) -> None:
+        """Save a single conversation, given as a Conversation or its dict form."""
         pass
     
     def load_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
         """Load a single conversation."""
         pass
     
+    def append_message(self, conversation_id: str, message_data: Dict[str, Any]) -> bool:
+        """Append a single message to a saved conversation.
+        
+        Returns False if the backend can't append, in which case the caller
+        must save the whole conversation instead.
+        """
+        return False
+    
+    def append_action(self, conversation_id: str, action_data: Dict[str, Any]) -> bool:
+        """Append a single action to a saved conversation.
+        
+        Returns False if the backend can't append, in which case the caller
+        must save the whole conversation instead.
+        """
+        return False
+    
+    def append_records(self, conversation_id: str, records: List[Tuple[str, Dict[str, Any]]]) -> bool:
+        """Append several ``("message" | "action", data)`` records to a saved conversation.
+        
+        Returns False if the backend can't append, in which case the caller
+        must save the whole conversation instead.
+        """
+        for record_type, data in records:
+            append = self.append_message if record_type == "message" else self.append_action
+            if not append(conversation_id, data):
+                return False
+        return True
+    
+    def flush(self) -> None:
+        """Make all previous writes durable."""
+        pass
+    
     def list_conversation_ids(self) -> List[str]:
         """List all available conversation IDs."""
         return []
@@ -122,21 +303,52 @@ class MemoryStorageBackend(StorageBackend):
         """Load the message store data."""
         return self.data
     
-    def save_conversation(self, conversation_id: str, conversation_data: Dict[str, Any]) -> None:
+    def save_conversation(self, conversation_id: str, conversation_data: Union[Dict[str, Any], BaseModel]) -> None:
         """Save a single conversation."""
+        if isinstance(conversation_data, BaseModel):
+            conversation_data = conversation_data.model_dump()
         self.data["conversations"][conversation_id] = conversation_data
     
     def load_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
         """Load a single conversation."""
         return self.data["conversations"].get(conversation_id)
     
+    def append_message(self, conversation_id: str, message_data: Dict[str, Any]) -> bool:
+        """Append a single message to a saved conversation."""
+        conversation_data = self.data["conversations"].get(conversation_id)
+        if conversation_data is None:
+            return False
+        conversation_data.setdefault("messages", []).append(message_data)
+        return True
+    
+    def append_action(self, conversation_id: str, action_data: Dict[str, Any]) -> bool:
+        """Append a single action to a saved conversation."""
+        conversation_data = self.data["conversations"].get(conversation_id)
+        if conversation_data is None:
+            return False
+        conversation_data.setdefault("actions", []).append(action_data)
+        return True
+    
     def list_conversation_ids(self) -> List[str]:
         """List all available conversation IDs."""
         return list(self.data["conversations"].keys())
 
 
 class FileStorageBackend(StorageBackend):
-    """File-based storage backend."""
+    """File-based storage backend.
+    
+    Each conversation is stored as a JSON snapshot (``{id}.json``) plus an
+    append-only log (``{id}.jsonl``) holding one record per message or action
+    added since the snapshot was written. Appending a message therefore
+    writes a single line instead of rewriting the whole conversation. The
+    log is replayed on load and folded back into the snapshot once it grows
+    past twice the size of the snapshot.
+    """
+    
+    # Minimum number of log records before a compaction is considered
+    COMPACT_MIN_RECORDS = 64
+    # Minimum number of conversations before they are loaded in parallel
+    PARALLEL_LOAD_MIN = 8
     
     def __init__(self, save_dir: str):
         # Convert relative paths to absolute paths based on the current working directory
@@ -150,16 +362,33 @@ class FileStorageBackend(StorageBackend):
         self.save_dir = Path(save_dir)
         self.store_file = self.save_dir / "message_store.json"
         self.conversations_dir = self.save_dir / "conversations"
+        
+        # Records in each conversation's snapshot and log, used to decide when to compact
+        self._snapshot_records: Dict[str, int] = {}
+        self._log_records: Dict[str, int] = {}
+        # Conversations with log writes that haven't been fsync'ed yet
+        self._unsynced: set = set()
+        # Conversation IDs known to be listed in the store index
+        self._indexed_ids: set = set()
+        # Serializes reads and read-modify-writes of the store index, which
+        # conversations saved from different threads all update
+        self._index_lock = threading.Lock()
     
     def initialize(self) -> None:
         """Create necessary directories."""
         self.save_dir.mkdir(exist_ok=True, parents=True)
         self.conversations_dir.mkdir(exist_ok=True, parents=True)
         
-        # Create store file if it doesn't exist
-        if not self.store_file.exists():
-            with open(self.store_file, 'w') as f:
-                json.dump({"conversation_ids": []}, f, indent=2)
+        with self._index_lock:
+            # Create store file if it doesn't exist
+            if not self.store_file.exists():
+                _write_json(self.store_file, {"conversation_ids": []})
+                return
+            
+            try:
+                self._indexed_ids = set(_read_json(self.store_file).get("conversation_ids", []))
+            except (orjson.JSONDecodeError, IOError) as e:
+                print(f"Error reading store index: {e}")
     
     def save_store(self, store_data: Dict[str, Any]) -> None:
         """Save the message store index."""
@@ -167,28 +396,20 @@ class FileStorageBackend(StorageBackend):
         self.save_dir.mkdir(exist_ok=True, parents=True)
         self.conversations_dir.mkdir(exist_ok=True, parents=True)
         
-        # Create a temporary file first to avoid corruption
-        temp_file = self.store_file.with_suffix('.tmp')
-        # Ensure temp file parent directory exists
-        temp_file.parent.mkdir(exist_ok=True, parents=True)
-        
-        # Extract conversation IDs
-        conversation_ids = list(store_data.get("conversations", {}).keys())
+        # Save each conversation individually, then write the index once
+        # (after the files it lists exist)
+        conversations = store_data.get("conversations", {})
+        for conv_id, conv_data in conversations.items():
+            self.save_conversation(conv_id, conv_data, update_index=False)
         
         # Save basic store info (without full conversations)
+        conversation_ids = list(conversations.keys())
         store_index = {
             "conversation_ids": conversation_ids
         }
-        
-        with open(temp_file, 'w') as f:
-            json.dump(store_index, f, indent=2, cls=DateTimeEncoder)
-        
-        # Atomic replace
-        shutil.move(temp_file, self.store_file)
-        
-        # Save each conversation individually
-        for conv_id, conv_data in store_data.get("conversations", {}).items():
-            self.save_conversation(conv_id, conv_data)
+        with self._index_lock:
+            _write_json(self.store_file, store_index)
+            self._indexed_ids = set(conversation_ids)
     
     def load_store(self) -> Optional[Dict[str, Any]]:
         """Load the message store."""
@@ -199,131 +420,259 @@ class FileStorageBackend(StorageBackend):
         
         # Load the store index
         try:
-            with open(self.store_file, 'r') as f:
-                store_index = json.load(f)
+            with self._index_lock:
+                store_index = _read_json(self.store_file)
             
             # Load each conversation
-            for conv_id in store_index.get("conversation_ids", []):
-                conversation = self.load_conversation(conv_id)
-                if conversation:
-                    store_data["conversations"][conv_id] = conversation
+            store_data["conversations"] = self._load_conversations(store_index.get("conversation_ids", []))
             
             # If no conversations were loaded from the index, try loading from files
             if not store_data["conversations"]:
-                conv_ids = self.list_conversation_ids()
-                for conv_id in conv_ids:
-                    conversation = self.load_conversation(conv_id)
-                    if conversation:
-                        store_data["conversations"][conv_id] = conversation
+                store_data["conversations"] = self._load_conversations(self.list_conversation_ids())
             
             return store_data
-        except (json.JSONDecodeError, IOError) as e:
+        except (orjson.JSONDecodeError, IOError) as e:
             print(f"Error loading message store: {e}")
             return {"conversations": {}}
     
-    def save_conversation(self, conversation_id: str, conversation_data: Dict[str, Any]) -> None:
-        """Save a single conversation to its own file."""
+    def _load_conversations(self, conversation_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Load several conversations, reading their files from a thread pool
+        when there are enough of them to be worth it."""
+        if len(conversation_ids) < self.PARALLEL_LOAD_MIN:
+            loaded = map(self.load_conversation, conversation_ids)
+        else:
+            with ThreadPoolExecutor(max_workers=min(32, len(conversation_ids))) as executor:
+                loaded = list(executor.map(self.load_conversation, conversation_ids))
+        return {
+            conv_id: conversation
+            for conv_id, conversation in zip(conversation_ids, loaded)
+            if conversation
+        }
+    
+    def save_conversation(
+        self,
+        conversation_id: str,
+        conversation_data: Union[Dict[str, Any], BaseModel],
+        update_index: bool = True
+    ) -> None:
+        """Save a single conversation to its own file.
+        
+        Args:
+            conversation_id: ID of the conversation
+            conversation_data: The Conversation, or its dict form
+            update_index: Whether to add the conversation to the store index
+                (save_store writes the index itself, once)
+        """
         # Ensure directory exists
         self.conversations_dir.mkdir(exist_ok=True, parents=True)
         
         conv_file = self.conversations_dir / f"{conversation_id}.json"
-        temp_file = conv_file.with_suffix('.tmp')
-        
-        # Ensure parent directory of temp file exists
-        temp_file.parent.mkdir(exist_ok=True, parents=True)
+        _write_json(conv_file, conversation_data)
         
-        # Write to temp file first
-        with open(temp_file, 'w') as f:
-            json.dump(conversation_data, f, indent=2, cls=DateTimeEncoder)
-        
-        # Atomic replace
-        shutil.move(temp_file, conv_file)
+        # The snapshot now contains everything in the log, so start a fresh one
+        self._log_file(conversation_id).unlink(missing_ok=True)
+        self._unsynced.discard(conversation_id)
+        self._snapshot_records[conversation_id] = _record_count(conversation_data)
+        self._log_records[conversation_id] = 0
         
         # Update the store file to include this conversation
-        self._update_store_index(conversation_id)
+        if update_index:
+            self._update_store_index(conversation_id)
     
     def _update_store_index(self, conversation_id: str) -> None:
         """Update the store index to include a conversation ID."""
-        # Ensure parent directory exists
-        self.save_dir.mkdir(exist_ok=True, parents=True)
-        
-        if not self.store_file.exists():
-            with open(self.store_file, 'w') as f:
-                json.dump({"conversation_ids": [conversation_id]}, f, indent=2)
+        # Already listed: skip reading and rewriting the index
+        if conversation_id in self._indexed_ids:
             return
         
-        try:
-            # Load existing data
-            with open(self.store_file, 'r') as f:
-                store_data = json.load(f)
+        with self._index_lock:
+            # Another thread may have added it while we waited for the lock
+            if conversation_id in self._indexed_ids:
+                return
             
-            # Add the conversation ID if not already present
-            if conversation_id not in store_data.get("conversation_ids", []):
-                store_data.setdefault("conversation_ids", []).append(conversation_id)
-                
-                # Write back to the file
-                temp_file = self.store_file.with_suffix('.tmp')
-                # Ensure temp file parent directory exists
-                temp_file.parent.mkdir(exist_ok=True, parents=True)
-                
-                with open(temp_file, 'w') as f:
-                    json.dump(store_data, f, indent=2)
+            # Ensure parent directory exists
+            self.save_dir.mkdir(exist_ok=True, parents=True)
+            
+            if not self.store_file.exists():
+                _write_json(self.store_file, {"conversation_ids": [conversation_id]})
+                self._indexed_ids.add(conversation_id)
+                return
+            
+            try:
+                # Load existing data
+                store_data = _read_json(self.store_file)
                 
-                # Atomic replace
-                shutil.move(temp_file, self.store_file)
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error updating store index: {e}")
+                # Add the conversation ID if not already present
+                if conversation_id not in store_data.get("conversation_ids", []):
+                    store_data.setdefault("conversation_ids", []).append(conversation_id)
+                    
+                    # Write back to the file
+                    _write_json(self.store_file, store_data)
+                self._indexed_ids.update(store_data["conversation_ids"])
+            except (orjson.JSONDecodeError, IOError) as e:
+                print(f"Error updating store index: {e}")
+    
+    def _log_file(self, conversation_id: str) -> Path:
+        """Path of the append-only log for a conversation."""
+        return self.conversations_dir / f"{conversation_id}.jsonl"
+    
+    def append_records(self, conversation_id: str, records: List[Tuple[str, Dict[str, Any]]]) -> bool:
+        """Append records to a conversation's log in one write, compacting it if it has grown too large."""
+        # Conversations saved or loaded by this backend are known to have a
+        # snapshot, so only unknown ones cost a stat call
+        if conversation_id not in self._snapshot_records:
+            conv_file = self.conversations_dir / f"{conversation_id}.json"
+            if not conv_file.exists():
+                return False
+        
+        with open(self._log_file(conversation_id), 'ab') as f:
+            f.write(b"".join(
+                orjson.dumps({"type": record_type, "data": data}) + b"\n"
+                for record_type, data in records
+            ))
+        self._unsynced.add(conversation_id)
+        
+        log_records = self._log_records.get(conversation_id, 0) + len(records)
+        self._log_records[conversation_id] = log_records
+        if log_records > max(self.COMPACT_MIN_RECORDS, 2 * self._snapshot_records.get(conversation_id, 0)):
+            self.compact(conversation_id)
+        return True
+    
+    def append_message(self, conversation_id: str, message_data: Dict[str, Any]) -> bool:
+        """Append a single message to the conversation's log."""
+        return self.append_records(conversation_id, [("message", message_data)])
+    
+    def append_action(self, conversation_id: str, action_data: Dict[str, Any]) -> bool:
+        """Append a single action to the conversation's log."""
+        return self.append_records(conversation_id, [("action", action_data)])
+    
+    def compact(self, conversation_id: str) -> None:
+        """Fold a conversation's log into its snapshot."""
+        conversation_data = self.load_conversation(conversation_id)
+        if conversation_data is not None:
+            self.save_conversation(conversation_id, conversation_data)
+    
+    def flush(self) -> None:
+        """fsync every log written to since the last flush."""
+        for conversation_id in list(self._unsynced):
+            try:
+                with open(self._log_file(conversation_id), 'rb') as f:
+                    os.fsync(f.fileno())
+            except FileNotFoundError:
+                pass
+        self._unsynced.clear()
+    
+    def _replay_log(self, conversation_id: str, conv_data: Dict[str, Any]) -> int:
+        """Apply the records in a conversation's log to its snapshot data.
+        
+        Returns the number of records in the log.
+        """
+        log_file = self._log_file(conversation_id)
+        if not log_file.exists():
+            return 0
+        
+        messages = conv_data.setdefault("messages", [])
+        actions = conv_data.setdefault("actions", [])
+        # A crash between writing a snapshot and removing the old log can leave
+        # records that are already in the snapshot, so skip any known IDs
+        seen_ids = {item.get("id") for item in messages}
+        seen_ids.update(item.get("id") for item in actions)
+        
+        num_records = 0
+        with open(log_file, 'rb') as f:
+            for line in f:
+                try:
+                    record = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # Partially written trailing record
+                    continue
+                num_records += 1
+                data = record.get("data", {})
+                if data.get("id") in seen_ids:
+                    continue
+                seen_ids.add(data.get("id"))
+                if record.get("type") == "message":
+                    messages.append(data)
+                elif record.get("type") == "action":
+                    actions.append(data)
+        return num_records
     
     def load_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
-        """Load a single conversation from its file."""
+        """Load a single conversation from its snapshot and log."""
         conv_file = self.conversations_dir / f"{conversation_id}.json"
         
         if not conv_file.exists():
             return None
         
         try:
-            with open(conv_file, 'r') as f:
-                conv_data = json.load(f)
-            
-            # Convert ISO datetime strings back to datetime objects
-            if "created_at" in conv_data and isinstance(conv_data["created_at"], str):
-                conv_data["created_at"] = datetime.fromisoformat(conv_data["created_at"])
-            
-            # Convert message datetimes
-            for msg in conv_data.get("messages", []):
-                if "created_at" in msg and isinstance(msg["created_at"], str):
-                    msg["created_at"] = datetime.fromisoformat(msg["created_at"])
-            
-            # Convert action datetimes
-            for action in conv_data.get("actions", []):
-                if "created_at" in action and isinstance(action["created_at"], str):
-                    action["created_at"] = datetime.fromisoformat(action["created_at"])
+            conv_data = _read_json(conv_file)
+            self._snapshot_records[conversation_id] = _record_count(conv_data)
+            self._log_records[conversation_id] = self._replay_log(conversation_id, conv_data)
             
+            # Datetimes stay ISO strings here: Conversation._from_stored_dict
+            # converts them while building the models, and compaction writes
+            # them back out unchanged
             return conv_data
-        except (json.JSONDecodeError, IOError) as e:
+        except (orjson.JSONDecodeError, IOError) as e:
             print(f"Error loading conversation {conversation_id}: {e}")
             return None
     
     def list_conversation_ids(self) -> List[str]:
         """List all conversation IDs from the file system."""
-        if not self.conversations_dir.exists():
+        try:
+            entries = os.scandir(self.conversations_dir)
+        except FileNotFoundError:
             return []
         
-        # Get all JSON files in the conversations directory
-        conv_files = list(self.conversations_dir.glob("*.json"))
-        
-        # Extract conversation IDs from filenames
-        return [f.stem for f in conv_files]
+        # Snapshot files are {id}.json (logs are .jsonl, temp files .tmp);
+        # matching on the entry names avoids a Path per file
+        with entries:
+            return [entry.name[:-5] for entry in entries if entry.name.endswith(".json")]
 
 
 class MessageStore:
     """A store for conversations and messages.
     
     If save_dir is provided, conversations will be persisted to disk.
+    
+    Adding a message or action only writes that record, so its cost doesn't
+    grow with the length of the conversation. Writes to the same
+    conversation are serialized by a per-conversation lock (agents with
+    synchronous handlers call the store from worker threads), while
+    different conversations don't contend with each other.
+    
+    With a flush_interval, adding a message only updates memory: records
+    are buffered and a background thread writes each conversation's batch
+    in one go every flush_interval seconds. With flush_every, records are
+    buffered the same way and a conversation's batch is written once it
+    holds flush_every records (the two can be combined). Call flush() (or
+    close()) to write them immediately; this also happens at interpreter
+    exit.
     """
     
-    def __init__(self, save_dir: Optional[str] = None, backend_type: Literal["memory", "file"] = "memory"):
+    def __init__(
+        self,
+        save_dir: Optional[str] = None,
+        backend_type: Literal["memory", "file"] = "memory",
+        flush_interval: float = 0,
+        flush_every: int = 0
+    ):
         self.conversations: Dict[str, Conversation] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        
+        # Write-behind state: records waiting to be written, per conversation
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self._write_behind = flush_interval > 0 or flush_every > 1
+        self._pending: Dict[str, List[Tuple[str, BaseModel]]] = {}
+        self._pending_lock = threading.Lock()
+        # Held while writing pending records, so batches reach the backend in order
+        self._write_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._flusher_started = False
+        # Nesting depth of batch() blocks; records are buffered while > 0
+        self._batch_depth = 0
+        self._closed = threading.Event()
         
         # Set up the storage backend
         if save_dir:
@@ -343,7 +692,7 @@ class MessageStore:
         store_data = self.backend.load_store()
         if store_data:
             for conv_id, conv_data in store_data.get("conversations", {}).items():
-                conversation = Conversation(**conv_data)
+                conversation = Conversation._from_stored_dict(conv_data)
                 self.conversations[conv_id] = conversation
     
     def _save_to_backend(self) -> None:
@@ -353,8 +702,72 @@ class MessageStore:
     
     def _save_conversation(self, conversation: Conversation) -> None:
         """Save a single conversation."""
-        conv_data = conversation.model_dump()
-        self.backend.save_conversation(conversation.id, conv_data)
+        # Backends serialize the model themselves (the file backend without an
+        # intermediate dict)
+        self.backend.save_conversation(conversation.id, conversation)
+    
+    def _conversation_lock(self, conversation_id: str) -> threading.Lock:
+        """Get the lock guarding writes to a conversation."""
+        lock = self._locks.get(conversation_id)
+        if lock is None:
+            # setdefault is atomic, so racing threads end up with the same lock
+            lock = self._locks.setdefault(conversation_id, threading.Lock())
+        return lock
+    
+    def _persist(self, conversation: Conversation, record_type: str, record: BaseModel) -> bool:
+        """Write a new message or action, or buffer it when writing behind.
+        
+        Returns True if the conversation's buffer has reached flush_every
+        records, in which case the caller should call _write_pending() once
+        it has released the conversation lock.
+        """
+        if self._write_behind or self._batch_depth:
+            with self._pending_lock:
+                records = self._pending.setdefault(conversation.id, [])
+                records.append((record_type, record))
+                full = self.flush_every > 0 and len(records) >= self.flush_every
+            if self._write_behind:
+                self._start_flusher()
+            return full
+        
+        # Persist just the new record; fall back to saving the whole conversation
+        if not self.backend.append_records(conversation.id, [(record_type, record.model_dump())]):
+            self._save_conversation(conversation)
+        return False
+    
+    def _start_flusher(self) -> None:
+        """Start the background thread that writes buffered records (if flushing
+        on an interval) and register the exit flush, once."""
+        if self._flusher_started:
+            return
+        with self._pending_lock:
+            if self._flusher_started:
+                return
+            self._flusher_started = True
+            if self.flush_interval > 0:
+                self._flusher = threading.Thread(target=self._flush_loop, name="aral-message-store-flusher", daemon=True)
+                self._flusher.start()
+        atexit.register(self.close)
+    
+    def _flush_loop(self) -> None:
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self._write_pending()
+            except Exception as e:
+                print(f"Error writing conversations: {e}")
+    
+    def _write_pending(self) -> None:
+        """Write all buffered records, one batch per conversation."""
+        with self._write_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            
+            for conversation_id, records in pending.items():
+                with self._conversation_lock(conversation_id):
+                    conversation = self.conversations[conversation_id]
+                    batch = [(record_type, record.model_dump()) for record_type, record in records]
+                    if not self.backend.append_records(conversation_id, batch):
+                        self._save_conversation(conversation)
     
     def get_conversation(self, conversation_id: str) -> Optional[Conversation]:
         """Get a conversation by ID."""
@@ -368,7 +781,7 @@ class MessageStore:
     ) -> Conversation:
         """Create a new conversation."""
         conversation = Conversation(
-            id=id or str(uuid.uuid4()),
+            id=id or _new_id(),
             title=title,
             metadata=metadata or {}
         )
@@ -387,15 +800,18 @@ class MessageStore:
         metadata: Optional[Dict[str, Any]] = None
     ) -> Message:
         """Add a message to a conversation."""
-        conversation = self.get_conversation(conversation_id)
-        if not conversation:
-            conversation = self.create_conversation(id=conversation_id)
-        
         message = Message(content=content, role=role, metadata=metadata or {})
-        conversation.add_message(message)
         
-        # Save the updated conversation
-        self._save_conversation(conversation)
+        with self._conversation_lock(conversation_id):
+            conversation = self.conversations.get(conversation_id)
+            if conversation is None:
+                conversation = self.create_conversation(id=conversation_id)
+            
+            conversation.add_message(message)
+            full = self._persist(conversation, "message", message)
+        
+        if full:
+            self._write_pending()
         
         return message
     
@@ -407,22 +823,64 @@ class MessageStore:
         metadata: Optional[Dict[str, Any]] = None
     ) -> ConversationAction:
         """Add an action to a conversation."""
-        conversation = self.get_conversation(conversation_id)
-        if not conversation:
-            conversation = self.create_conversation(id=conversation_id)
-        
         action = ConversationAction(
             action_type=action_type, 
             data=data, 
             metadata=metadata or {}
         )
-        conversation.add_action(action)
         
-        # Save the updated conversation
-        self._save_conversation(conversation)
+        with self._conversation_lock(conversation_id):
+            conversation = self.conversations.get(conversation_id)
+            if conversation is None:
+                conversation = self.create_conversation(id=conversation_id)
+            
+            conversation.add_action(action)
+            full = self._persist(conversation, "action", action)
+        
+        if full:
+            self._write_pending()
         
         return action
     
+    @contextmanager
+    def batch(self):
+        """Defer writing added messages and actions until the block exits.
+        
+        Records added inside the block (from any thread) are buffered and
+        written in one batch per conversation when the outermost batch()
+        exits, even if it exits with an exception:
+        
+            with store.batch():
+                for content in contents:
+                    store.add_message(conversation_id, content)
+        
+        Yields:
+            MessageStore: This store
+        """
+        with self._pending_lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._pending_lock:
+                self._batch_depth -= 1
+                outermost = self._batch_depth == 0
+            if outermost:
+                self._write_pending()
+    
+    def flush(self) -> None:
+        """Write any buffered records and make all persisted changes durable
+        (fsync for the file backend)."""
+        self._write_pending()
+        self.backend.flush()
+    
+    def close(self) -> None:
+        """Stop the background writer and flush everything to the backend."""
+        self._closed.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        self.flush()
+    
     def get_all_conversations(self) -> List[Conversation]:
         """Get all conversations."""
         return list(self.conversations.values())
@@ -447,7 +905,7 @@ class MessageStore:
         """Convert the message store to a dictionary."""
         return {
             "conversations": {
-                conv_id: conv.model_dump() 
+                conv_id: conv.model_dump()
                 for conv_id, conv in self.conversations.items()
             }
         }
@@ -458,7 +916,7 @@ class MessageStore:
         store = cls()
         
         for conv_id, conv_data in data.get("conversations", {}).items():
-            conversation = Conversation(**conv_data)
+            conversation = Conversation._from_stored_dict(conv_data)
             store.conversations[conv_id] = conversation
         
         return store 
\ No newline at end of file
@@ -0,0 +1,39 @@
+import functools
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; counts are estimated without it
+    tiktoken = None
+
+# Model whose tokenizer is used when none is given
+DEFAULT_MODEL = "gpt-4o"
+# Average characters per token for English text, used without tiktoken
+CHARS_PER_TOKEN = 4
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model: str):
+    """Load a model's tokenizer once."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Count the tokens in a piece of text.
+    
+    Uses the model's tiktoken tokenizer when tiktoken is installed and
+    otherwise estimates from the length of the text.
+    
+    Args:
+        text: The text to count
+        model: Model whose tokenizer to use (defaults to DEFAULT_MODEL)
+        
+    Returns:
+        int: The number of tokens
+    """
+    if tiktoken is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(_encoding(model or DEFAULT_MODEL).encode(text))
@@ -1,101 +1,242 @@
 import os
+import gzip
+import shutil
+import hashlib
+import functools
 import subprocess
 from pathlib import Path
 
+try:
+    import brotli
+except ImportError:  # brotli is optional; only gzip variants are produced without it
+    brotli = None
+
+# Text assets worth serving precompressed; images and fonts are already compressed
+COMPRESSIBLE_SUFFIXES = {".js", ".css", ".html", ".json", ".svg", ".txt"}
+
+# Files whose contents determine the installed dependencies
+DEPENDENCY_FILES = ["package.json", "bun.lockb", "bun.lock"]
+# Directories that are build inputs or outputs rather than sources
+NON_SOURCE_DIRS = {"node_modules", ".next", "out"}
+
+# Hash stamps recording what the current node_modules / out were produced from.
+# The build stamp lives in .next rather than in out, which is served at /.
+INSTALL_HASH_FILE = ".aral-install-hash"
+BUILD_HASH_FILE = ".aral-build-hash"
+
+# Package managers to try, in order: (name, install command, build command)
+PACKAGE_MANAGERS = [
+    ("Bun", ["bun", "install"], ["bun", "run", "build"]),
+    ("pnpm", ["pnpm", "install"], ["pnpm", "run", "build"]),
+    ("npm", ["npm", "install"], ["npm", "run", "build"]),
+]
+# Extra install arguments used in CI, where the lockfile must already match
+# package.json. Locally an outdated lockfile is updated instead.
+CI_INSTALL_ARGS = {"Bun": ["--frozen-lockfile"]}
+
+def _hash_files(paths, root, extra=""):
+    """SHA-256 over the relative path and contents of each existing file."""
+    digest = hashlib.sha256(extra.encode())
+    for path in paths:
+        if path.is_file():
+            digest.update(str(path.relative_to(root)).encode())
+            digest.update(b"\0")
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+def dependencies_hash(frontend_dir):
+    """Hash of the package manifest and lockfiles."""
+    return _hash_files([frontend_dir / name for name in DEPENDENCY_FILES], frontend_dir)
+
+def sources_hash(frontend_dir, api_url=None):
+    """Hash of every frontend source file, plus the API URL baked into the build."""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(frontend_dir):
+        # Prune build inputs/outputs in place so os.walk doesn't descend into them
+        dirnames[:] = sorted(d for d in dirnames if d not in NON_SOURCE_DIRS)
+        paths.extend(Path(dirpath) / name for name in sorted(filenames))
+    return _hash_files(paths, frontend_dir, extra=api_url or "")
+
+def _stamp_matches(stamp_file, expected):
+    try:
+        return stamp_file.read_text().strip() == expected
+    except OSError:
+        return False
+
+@functools.lru_cache(maxsize=None)
+def available_package_managers():
+    """
+    Find the installed package managers with a PATH lookup instead of
+    spawning each one. The result is cached for the life of the process.
+
+    Returns:
+        tuple: (name, install command, build command) for each installed
+            package manager, in order of preference, with the executable
+            resolved to an absolute path.
+    """
+    found = []
+    for name, install_cmd, build_cmd in PACKAGE_MANAGERS:
+        executable = shutil.which(install_cmd[0])
+        if executable:
+            found.append((name, [executable, *install_cmd[1:]], [executable, *build_cmd[1:]]))
+    return tuple(found)
+
+def dev_server_command(port):
+    """
+    Command that runs the Next.js dev server with the preferred installed
+    package manager.
+
+    Args:
+        port: Port for the dev server
+
+    Returns:
+        list: The command, or None if no package manager is installed.
+    """
+    managers = available_package_managers()
+    if not managers:
+        return None
+    name, _, build_cmd = managers[0]
+    executable = build_cmd[0]
+    # npm only forwards script arguments that come after "--"
+    separator = ["--"] if name == "npm" else []
+    return [executable, "run", "dev", *separator, "--port", str(port)]
+
+def _run_with_package_manager(step, frontend_dir, env):
+    """
+    Run the install or build step with the first available package manager.
+
+    Args:
+        step: Either "install" or "build"
+        frontend_dir: Directory to run the command in
+        env: Environment for the subprocess
+
+    Returns:
+        str: Name of the package manager that succeeded, or None if all failed.
+    """
+    managers = available_package_managers()
+    if not managers:
+        print("❌ Error: No package manager found on PATH.")
+        return None
+
+    for name, install_cmd, build_cmd in managers:
+        if step == "install":
+            cmd = install_cmd + (CI_INSTALL_ARGS.get(name, []) if env.get("CI") else [])
+        else:
+            cmd = build_cmd
+        try:
+            print(f"Running {name} {' '.join(cmd[1:])}...")
+            subprocess.run(cmd, check=True, env=env, cwd=str(frontend_dir))
+            return name
+        except subprocess.CalledProcessError as e:
+            # The command's own output (e.g. an outdated lockfile) is shown above
+            print(f"⚠️ {name} {step} failed with exit code {e.returncode}, trying the next package manager...")
+        except (subprocess.SubprocessError, OSError) as e:
+            print(f"⚠️ {name} {step} failed ({e}), trying the next package manager...")
+    return None
+
 def ensure_deps(frontend_dir=None):
     """
-    Ensure that dependencies are installed by checking if node_modules exists.
-    If node_modules doesn't exist, attempt to install dependencies using bun or npm.
-    
+    Ensure that dependencies are installed and match package.json and the lockfile.
+    Installation is skipped when node_modules was installed from the same
+    manifest/lockfile contents; otherwise bun, pnpm or npm is used.
+
     Args:
         frontend_dir: Path to the frontend directory. If None, it will be determined automatically.
-        
+
     Returns:
         bool: True if dependencies are installed or were successfully installed, False otherwise.
     """
     if frontend_dir is None:
         frontend_dir = Path(__file__).parent / "frontend"
-    
+    frontend_dir = Path(frontend_dir)
+
     if not frontend_dir.exists():
         print(f"❌ Error: Frontend directory not found at {frontend_dir}")
         return False
-    
+
     node_modules = frontend_dir / "node_modules"
-    
-    # If node_modules already exists, we're good
-    if node_modules.exists() and node_modules.is_dir():
+    stamp_file = node_modules / INSTALL_HASH_FILE
+    deps_hash = dependencies_hash(frontend_dir)
+
+    # If node_modules was installed from the same package.json/lockfile, we're good
+    if node_modules.is_dir() and _stamp_matches(stamp_file, deps_hash):
         print("✅ Dependencies already installed.")
         return True
-    
+
     # Otherwise, we need to install dependencies
     print("📦 Installing dependencies...")
-    current_dir = os.getcwd()  # Save current directory
-    
-    try:
-        os.chdir(frontend_dir)
-        env = os.environ.copy()
-        
-        # Try with bun first
-        try:
-            print("Installing dependencies with Bun...")
-            subprocess.run(["bun", "install"], check=True, env=env)
-            print("✅ Dependencies installed successfully with Bun.")
-            return True
-        except (subprocess.SubprocessError, FileNotFoundError):
-            # Fall back to npm
-            try:
-                print("Bun not found, trying with npm...")
-                subprocess.run(["npm", "install"], check=True, env=env)
-                print("✅ Dependencies installed successfully with npm.")
-                return True
-            except (subprocess.SubprocessError, FileNotFoundError):
-                print("❌ Error: Could not install dependencies. Please install bun or npm.")
-                return False
-    finally:
-        os.chdir(current_dir)  # Restore original directory
+    name = _run_with_package_manager("install", frontend_dir, os.environ.copy())
+    if name is None:
+        print("❌ Error: Could not install dependencies. Please install bun, pnpm or npm.")
+        return False
+
+    stamp_file.write_text(deps_hash)
+    print(f"✅ Dependencies installed successfully with {name}.")
+    return True
+
+def precompress_assets(out_dir):
+    """
+    Write .gz (and, if brotli is installed, .br) siblings for every
+    compressible file in the static export, so the server can send them
+    without compressing on each request.
+
+    Args:
+        out_dir: Path to the Next.js static export directory
+
+    Returns:
+        int: Number of files compressed
+    """
+    count = 0
+    for path in Path(out_dir).rglob("*"):
+        if not path.is_file() or path.suffix not in COMPRESSIBLE_SUFFIXES:
+            continue
+        data = path.read_bytes()
+        path.with_name(path.name + ".gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            path.with_name(path.name + ".br").write_bytes(brotli.compress(data, quality=11))
+        count += 1
+    return count
 
 def build_frontend(api_url=None):
     frontend_dir = Path(__file__).parent / "frontend"
-    if frontend_dir.exists():
-        current_dir = os.getcwd()  # Save current directory
-        os.chdir(frontend_dir)
-        
-        # Set up environment variables for the build
-        env = os.environ.copy()
-        if api_url:
-            env["NEXT_PUBLIC_API_URL"] = api_url
-            print(f"Setting API URL for build: {api_url}")
-        
-        # Ensure dependencies are installed first
-        if not ensure_deps(frontend_dir):
-            print("❌ Cannot build frontend without dependencies.")
-            os.chdir(current_dir)
-            return False
-        
-        try:
-            # Try with bun first
-            print("Building UI with Bun...")
-            subprocess.run(["bun", "run", "build"], check=True, env=env)
-            print(f"✅ UI built successfully at {os.path.abspath(frontend_dir / 'out')}")
-            return True
-        except (subprocess.SubprocessError, FileNotFoundError):
-            # Fall back to npm
-            try:
-                print("Bun not found, trying with npm...")
-                subprocess.run(["npm", "run", "build"], check=True, env=env)
-                print(f"✅ UI built successfully at {os.path.abspath(frontend_dir / 'out')}")
-                return True
-            except (subprocess.SubprocessError, FileNotFoundError):
-                print("❌ Error: Could not build the UI. Please install bun or npm.")
-                return False
-        finally:
-            os.chdir(current_dir)  # Restore original directory
-    else:
+    if not frontend_dir.exists():
         print(f"❌ Error: Frontend directory not found at {frontend_dir}")
         return False
 
+    out_dir = frontend_dir / "out"
+    stamp_file = frontend_dir / ".next" / BUILD_HASH_FILE
+
+    # Set up environment variables for the build
+    env = os.environ.copy()
+    if api_url:
+        env["NEXT_PUBLIC_API_URL"] = api_url
+        print(f"Setting API URL for build: {api_url}")
+
+    # Skip the build entirely if the export was produced from the same sources
+    build_hash = sources_hash(frontend_dir, api_url)
+    if out_dir.is_dir() and _stamp_matches(stamp_file, build_hash):
+        print(f"✅ UI is up to date at {os.path.abspath(out_dir)}")
+        return True
+
+    # Ensure dependencies are installed first
+    if not ensure_deps(frontend_dir):
+        print("❌ Cannot build frontend without dependencies.")
+        return False
+
+    print("Building UI...")
+    name = _run_with_package_manager("build", frontend_dir, env)
+    if name is None:
+        print("❌ Error: Could not build the UI. Please install bun, pnpm or npm.")
+        return False
+
+    print(f"✅ UI built successfully with {name} at {os.path.abspath(out_dir)}")
+    print(f"🗜️ Precompressed {precompress_assets(out_dir)} static assets")
+    stamp_file.parent.mkdir(exist_ok=True)
+    stamp_file.write_text(build_hash)
+    return True
+
 def main():
     build_frontend()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
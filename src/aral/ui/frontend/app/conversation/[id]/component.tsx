@@ -3,7 +3,7 @@
 import { useState, useEffect, useRef } from "react";
 import { useParams, useRouter } from "next/navigation";
 import { v4 as uuidv4 } from "uuid";
-import { fetchConversations, sendMessage } from "@/lib/api";
+import { fetchConversations, streamMessage, subscribeToUpdates } from "@/lib/api";
 import { Sidebar } from "@/components/ui/sidebar";
 import { MessageInput } from "@/components/ui/message-input";
 import { LoadingDots } from "@/components/ui/loading-dots";
@@ -40,6 +40,7 @@ export default function ConversationPageComponent() {
     const [error, setError] = useState<string | null>(null);
     const [initialLoadComplete, setInitialLoadComplete] = useState<boolean>(false);
     const [isWaitingForResponse, setIsWaitingForResponse] = useState<boolean>(false);
+    const [toolStatus, setToolStatus] = useState<string | null>(null);
 
     // Fetch conversations
     useEffect(() => {
@@ -68,6 +69,22 @@ export default function ConversationPageComponent() {
         }
     }, [conversationId, router]);
 
+    // Show tool progress sent by the agent while it works on a reply
+    useEffect(() => {
+        if (!conversationId) {
+            return;
+        }
+        return subscribeToUpdates(conversationId, (updates) => {
+            for (const update of updates) {
+                if (update.type === "tool_call") {
+                    setToolStatus(`Using ${update.name}...`);
+                } else if (update.type === "tool_result") {
+                    setToolStatus(null);
+                }
+            }
+        });
+    }, [conversationId]);
+
     // Handle scrolling behavior
     useEffect(() => {
         // On initial load, scroll to bottom immediately without animation
@@ -142,8 +159,31 @@ export default function ConversationPageComponent() {
             // Show loading indicator for this specific message
             setIsWaitingForResponse(true);
 
-            // Send the message to the API
-            await sendMessage(conversationId, messageContent);
+            // Stream the assistant's reply into a placeholder message as it arrives
+            const assistantMessageId = uuidv4();
+            let streamedContent = "";
+            await streamMessage(conversationId, messageContent, (delta) => {
+                streamedContent += delta;
+                setIsWaitingForResponse(false);
+                setConversations((prev) => prev.map((conv: Conversation) => {
+                    if (conv.id !== conversationId) {
+                        return conv;
+                    }
+                    const assistantMessage: Message = {
+                        id: assistantMessageId,
+                        content: streamedContent,
+                        role: "assistant",
+                        created_at: new Date().toISOString(),
+                    };
+                    return {
+                        ...conv,
+                        messages: [
+                            ...conv.messages.filter((msg: Message) => msg.id !== assistantMessageId),
+                            assistantMessage,
+                        ],
+                    };
+                }));
+            });
 
             // Refresh conversations to get the assistant's response
             const data = await fetchConversations();
@@ -156,6 +196,7 @@ export default function ConversationPageComponent() {
             setError("Failed to send message. Please try again.");
         } finally {
             setIsWaitingForResponse(false);
+            setToolStatus(null);
         }
     };
     const currentConversation = conversations.find((conv: Conversation) => conv.id === conversationId);
@@ -271,13 +312,15 @@ export default function ConversationPageComponent() {
                                 );
                             })}
 
-                            {/* Loading indicator when waiting for response */}
-                            {isWaitingForResponse && (
+                            {/* Loading indicator when waiting for response, and while
+                                a tool runs (which can be after the first text arrives) */}
+                            {(isWaitingForResponse || toolStatus) && (
                                 <div className="flex justify-start">
                                     <div className="flex gap-2 max-w-[80%]">
                                         <Message.Avatar role="assistant" />
                                         <div className="rounded-2xl px-3 py-2 bg-white/80 backdrop-blur-sm text-gray-800 shadow-sm relative z-20">
                                             <p className="text-sm flex items-center">
+                                                {toolStatus && <span className="mr-2">{toolStatus}</span>}
                                                 <LoadingDots />
                                             </p>
                                         </div>
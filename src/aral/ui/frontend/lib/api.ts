@@ -42,4 +42,75 @@ export async function sendMessage(conversationId: string, message: string) {
   }
 
   return response.json();
-} 
\ No newline at end of file
+}
+
+// Send a message and receive the reply as it is generated. The server sends
+// server-sent events over the POST response: `data: {"delta": "..."}` for
+// each chunk, then an `event: done` (or `event: error`) event.
+export async function streamMessage(
+  conversationId: string,
+  message: string,
+  onDelta: (delta: string) => void,
+) {
+  const response = await fetch(getApiUrl('/api/message/stream'), {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      Accept: 'text/event-stream',
+    },
+    body: JSON.stringify({
+      conversation_id: conversationId,
+      message,
+    }),
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error(`API error: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = 'message';
+      let data = '';
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      }
+
+      if (event === 'error') {
+        throw new Error(JSON.parse(data).detail || 'Failed to process message');
+      }
+      if (event === 'done') {
+        return;
+      }
+      onDelta(JSON.parse(data).delta);
+    }
+  }
+}
+
+// Subscribe to the updates (e.g. tool progress) the agent sends for a
+// conversation. Updates arrive in batches, one server-sent event per batch.
+// Returns a function that closes the subscription.
+export function subscribeToUpdates(
+  conversationId: string,
+  onUpdates: (updates: Record<string, unknown>[]) => void,
+) {
+  const source = new EventSource(
+    getApiUrl(`/api/conversations/${encodeURIComponent(conversationId)}/updates`),
+  );
+  source.onmessage = (event) => onUpdates(JSON.parse(event.data));
+  return () => source.close();
+}
@@ -1,16 +1,23 @@
 import os
+import inspect
+import mimetypes
 from pathlib import Path
-from fastapi import FastAPI, Request, Body
-from fastapi.responses import HTMLResponse, JSONResponse
+import orjson
+from fastapi import FastAPI
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.staticfiles import NotModifiedResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 
 
 class MessageRequest(BaseModel):
-    conversation_id: str
-    message: str
+    conversation_id: str = Field(min_length=1)
+    message: str = Field(min_length=1)
 
 
 class MessageResponse(BaseModel):
@@ -34,11 +41,123 @@ class ConversationsResponse(BaseModel):
     conversations: List[Conversation]
 
 
+def _orjson_default(obj):
+    """Encode objects orjson doesn't handle natively (Pydantic models, plain objects)."""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if hasattr(obj, "__dict__"):
+        return obj.__dict__
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson instead of the stdlib encoder."""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _accepted_encodings(scope) -> set:
+    """Content codings the client accepts, ignoring any with q=0."""
+    header = Headers(scope=scope).get("accept-encoding", "")
+    encodings = set()
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                pass
+        encodings.add(coding.strip().lower())
+    return encodings
+
+
+class FrontendStaticFiles(StaticFiles):
+    """StaticFiles for the Next.js export.
+    
+    Build assets under /_next/static/ have content-hashed filenames, so they
+    are served with a long-lived immutable Cache-Control header and browsers
+    never re-request them. Everything else keeps StaticFiles' ETag and
+    Last-Modified revalidation.
+    
+    If the build step left a precompressed ``.br`` or ``.gz`` sibling next
+    to a file and the client accepts that encoding, the sibling is sent
+    with Content-Encoding set instead of the uncompressed file. Files with
+    a sibling are sent with ``Vary: Accept-Encoding`` either way, so shared
+    caches keep the variants apart.
+    """
+    
+    IMMUTABLE_PREFIX = "/_next/static/"
+    IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+    # Preferred first
+    PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+    
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = self._precompressed_response(full_path, scope, status_code)
+        if response is None:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+            if any(os.path.exists(f"{full_path}{suffix}") for _, suffix in self.PRECOMPRESSED):
+                response.headers["vary"] = "Accept-Encoding"
+        if scope["path"].startswith(self.IMMUTABLE_PREFIX):
+            response.headers["cache-control"] = self.IMMUTABLE_CACHE_CONTROL
+        return response
+    
+    def _precompressed_response(self, full_path, scope, status_code):
+        """Return a response for a precompressed sibling of full_path, if one applies."""
+        accepted = _accepted_encodings(scope)
+        for encoding, suffix in self.PRECOMPRESSED:
+            if encoding not in accepted:
+                continue
+            try:
+                compressed_stat = os.stat(f"{full_path}{suffix}")
+            except OSError:
+                continue
+            
+            media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+            response = FileResponse(
+                f"{full_path}{suffix}",
+                status_code=status_code,
+                media_type=media_type,
+                stat_result=compressed_stat,
+            )
+            response.headers["content-encoding"] = encoding
+            response.headers["vary"] = "Accept-Encoding"
+            if self.is_not_modified(response.headers, Headers(scope=scope)):
+                return NotModifiedResponse(response.headers)
+            return response
+        return None
+
+
+class APIGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware applied to the JSON API only.
+    
+    Static files are either served precompressed by FrontendStaticFiles or
+    are images and fonts that are already compressed, and server-sent event
+    streams must reach the client unbuffered, so those pass through as is.
+    """
+    
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] == "http"
+            and scope["path"].startswith("/api/")
+            and "text/event-stream" not in Headers(scope=scope).get("accept", "")
+        ):
+            await super().__call__(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
 class UIServer:
     def __init__(self, agent, api_only=False):
         self.agent = agent
         self.api_only = api_only
-        self.app = FastAPI()
+        self.app = FastAPI(default_response_class=ORJSONResponse)
+        # Optional agent hooks for the conversation list, resolved once
+        # rather than probed on every request (None if not implemented)
+        self._iter_conversations_json = getattr(agent, "iter_conversations_json", None)
+        self._get_conversations = getattr(agent, "get_conversations", None)
         
         # Setup CORS
         self.app.add_middleware(
@@ -48,37 +167,46 @@ class UIServer:
             allow_methods=["*"],
             allow_headers=["*"],
         )
+        # Compress larger API responses (e.g. the conversation list)
+        self.app.add_middleware(APIGZipMiddleware, minimum_size=1024)
         
-        # Mount the Next.js static files - using static export
-        # Only if not in API-only mode
-        if not api_only:
-            static_export_dir = Path(__file__).parent / "frontend" / "out"
-            if static_export_dir.exists():
-                # Mount the static export at root
-                self.app.mount("/", StaticFiles(directory=str(static_export_dir), html=True), name="static-export")
+        # Resolve the Next.js static export once and keep the SPA shell in
+        # memory, so conversation routes don't touch the disk per request
+        self.static_export_dir = Path(__file__).parent / "frontend" / "out"
+        self.ui_built = not api_only and self.static_export_dir.exists()
+        self._index_html = None
+        if self.ui_built:
+            index_path = self.static_export_dir / "index.html"
+            if index_path.exists():
+                self._index_html = index_path.read_bytes()
         
         # API routes
         self.setup_routes()
+        
+        # Mount the Next.js static files - using static export
+        # Mounted after the routes above, since a mount at root matches every path
+        if self.ui_built:
+            self.app.mount("/", FrontendStaticFiles(directory=str(self.static_export_dir), html=True), name="static-export")
     
     def setup_routes(self):
         @self.app.post("/api/message")
-        async def handle_message(request: Request):
-            data = await request.json()
-            conversation_id = data.get("conversation_id")
-            message = data.get("message")
-            
-            if not conversation_id or not message:
-                return JSONResponse(
-                    status_code=400,
-                    content={"error": "conversation_id and message are required"}
-                )
+        async def handle_message(payload: MessageRequest):
+            # The body is validated by pydantic-core before we get here;
+            # missing or empty fields are rejected with a 422
+            conversation_id = payload.conversation_id
+            message = payload.message
             try:
-                response = self.agent.on_message(conversation_id, message)
-                return JSONResponse(content={"response": response})
+                # Agents that still define a synchronous on_message are run in
+                # the threadpool so a slow LLM call doesn't block the event loop
+                if inspect.iscoroutinefunction(self.agent.on_message):
+                    response = await self.agent.on_message(conversation_id, message)
+                else:
+                    response = await run_in_threadpool(self.agent.on_message, conversation_id, message)
+                return ORJSONResponse(content={"response": response})
             except Exception as e:
                 # Log the error
                 print(f"Error handling message: {str(e)}")
-                return JSONResponse(
+                return ORJSONResponse(
                     status_code=500,
                     content={
                         "error": "Failed to process message",
@@ -86,35 +214,75 @@ class UIServer:
                     }
                 )
         
+        @self.app.post("/api/message/stream")
+        async def stream_message(payload: MessageRequest):
+            async def event_stream():
+                try:
+                    if hasattr(self.agent, "on_message_stream"):
+                        async for chunk in self.agent.on_message_stream(payload.conversation_id, payload.message):
+                            yield b"data: " + orjson.dumps({"delta": chunk}) + b"\n\n"
+                    else:
+                        # Agents without streaming support send their whole reply as one event
+                        if inspect.iscoroutinefunction(self.agent.on_message):
+                            response = await self.agent.on_message(payload.conversation_id, payload.message)
+                        else:
+                            response = await run_in_threadpool(self.agent.on_message, payload.conversation_id, payload.message)
+                        yield b"data: " + orjson.dumps({"delta": response}) + b"\n\n"
+                    yield b"event: done\ndata: {}\n\n"
+                except Exception as e:
+                    # Log the error
+                    print(f"Error streaming message: {str(e)}")
+                    error = {"error": "Failed to process message", "detail": str(e)}
+                    yield b"event: error\ndata: " + orjson.dumps(error) + b"\n\n"
+            
+            return StreamingResponse(event_stream(), media_type="text/event-stream")
+        
+        @self.app.get("/api/conversations/{conversation_id}/updates")
+        async def conversation_updates(conversation_id: str):
+            if not hasattr(self.agent, "updates"):
+                return ORJSONResponse(status_code=404, content={"error": "Agent does not send updates"})
+            
+            async def event_stream():
+                # Each batch of updates arrives as an encoded JSON array and is sent as one event
+                async for batch in self.agent.updates(conversation_id):
+                    yield b"data: " + batch + b"\n\n"
+            
+            return StreamingResponse(event_stream(), media_type="text/event-stream")
+        
         @self.app.get("/api/conversations")
         async def get_conversations():
             # This would need to be implemented in your agent
-            if hasattr(self.agent, "get_conversations"):
-                conversations = self.agent.get_conversations()
-                return JSONResponse(content={"conversations": conversations})
-            return JSONResponse(content={"conversations": []})
+            if self._iter_conversations_json is not None:
+                # Already-encoded JSON from per-conversation caches, streamed in
+                # chunks (StreamingResponse iterates it in the threadpool)
+                return StreamingResponse(self._iter_conversations_json(), media_type="application/json")
+            if self._get_conversations is not None:
+                # May read from storage, so keep it off the event loop
+                conversations = await run_in_threadpool(self._get_conversations)
+                return ORJSONResponse(content={"conversations": conversations})
+            return ORJSONResponse(content={"conversations": []})
         
-        # Only add the catch-all route if not in API-only mode
-        if not self.api_only:
+        if self.api_only:
+            return
+        
+        if not self.ui_built:
             @self.app.get("/{full_path:path}")
-            async def serve_frontend(full_path: str, request: Request):
-                # Only reached if the static files mount doesn't handle the request
-                static_export_dir = Path(__file__).parent / "frontend" / "out"
-                if not static_export_dir.exists():
-                    return HTMLResponse(content="UI not built. Run 'cd src/aral/ui/frontend && bun run build' to build the UI.")
-                
-                # Check if this is a Next.js dynamic route
-                if full_path.startswith("conversation/"):
-                    # Serve the index.html for the conversation route
-                    index_path = static_export_dir / "index.html"
-                    if index_path.exists():
-                        with open(index_path, "r") as f:
-                            content = f.read()
-                        return HTMLResponse(content=content)
-                
-                # If we get here, the path wasn't found in the static export
+            async def serve_frontend(full_path: str):
+                return HTMLResponse(content="UI not built. Run 'cd src/aral/ui/frontend && bun run build' to build the UI.")
+            return
+        
+        # Next.js dynamic route: serve the cached SPA shell
+        @self.app.get("/conversation/{conversation_path:path}")
+        async def serve_conversation(conversation_path: str):
+            if self._index_html is None:
                 return HTMLResponse(content="Page not found", status_code=404)
+            return HTMLResponse(content=self._index_html)
     
     def run(self, host="0.0.0.0", port=3000):
         import uvicorn
-        uvicorn.run(self.app, host=host, port=port) 
\ No newline at end of file
+        # uvicorn picks uvloop and httptools by itself when they are
+        # installed, so installing the optional uvloop extra is all it takes
+        # to switch; without it the standard asyncio loop and h11 are used.
+        # Multiple workers aren't an option: they need an import string,
+        # while this app wraps an agent that lives in this process.
+        uvicorn.run(self.app, host=host, port=port)
@@ -7,14 +7,16 @@ from pathlib import Path
 
 from src.aral.storage import MessageStore, Message, Conversation, ConversationAction
 
+# Keep test stores in memory-backed tmpfs where available
+TEMP_ROOT = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
 
 class TestFileMessageStore(unittest.TestCase):
     """Test the MessageStore class with file persistence."""
     
     def setUp(self):
         """Set up a temporary directory for testing."""
-        self.temp_dir = tempfile.mkdtemp()
-        print(f"\nTest temp dir: {self.temp_dir}")
+        self.temp_dir = tempfile.mkdtemp(dir=TEMP_ROOT)
         self.store = MessageStore(save_dir=self.temp_dir)
     
     def tearDown(self):
@@ -37,25 +39,17 @@ class TestFileMessageStore(unittest.TestCase):
         # Check that the file exists
         conv_file = Path(self.temp_dir) / "conversations" / "test-conv-1.json"
         self.assertTrue(conv_file.exists())
-        print(f"Conversation file exists: {conv_file}")
         
         # Check file contents
         with open(conv_file, 'r') as f:
             conv_data = json.load(f)
-            print(f"Conversation file contents: {json.dumps(conv_data, indent=2)}")
+        self.assertEqual(conv_data["id"], "test-conv-1")
         
         # Create a new store and load from the same directory
         new_store = MessageStore(save_dir=self.temp_dir)
         
         # Check that the conversation was loaded
         loaded_conv = new_store.get_conversation("test-conv-1")
-        print(f"Loaded conversation: {loaded_conv}")
-        if loaded_conv:
-            print(f"Loaded conversation ID: {loaded_conv.id}")
-            print(f"Loaded conversation title: {loaded_conv.title}")
-        
-        # Check store contents
-        print(f"New store conversations: {list(new_store.conversations.keys())}")
         
         self.assertIsNotNone(loaded_conv)
         self.assertEqual(loaded_conv.id, "test-conv-1")
@@ -80,19 +74,13 @@ class TestFileMessageStore(unittest.TestCase):
         conv_file = Path(self.temp_dir) / "conversations" / "test-conv-1.json"
         with open(conv_file, 'r') as f:
             conv_data = json.load(f)
-            print(f"Conversation file contents: {json.dumps(conv_data, indent=2)}")
+        self.assertEqual(conv_data["id"], "test-conv-1")
         
         # Create a new store and load from the same directory
         new_store = MessageStore(save_dir=self.temp_dir)
         
         # Check that the message was loaded
         loaded_conv = new_store.get_conversation("test-conv-1")
-        print(f"Loaded conversation: {loaded_conv}")
-        if loaded_conv:
-            print(f"Loaded conversation messages: {loaded_conv.messages}")
-        
-        # Check store contents
-        print(f"New store conversations: {list(new_store.conversations.keys())}")
         
         self.assertIsNotNone(loaded_conv)
         self.assertEqual(len(loaded_conv.messages), 1)
@@ -118,25 +106,156 @@ class TestFileMessageStore(unittest.TestCase):
         conv_file = Path(self.temp_dir) / "conversations" / "test-conv-1.json"
         with open(conv_file, 'r') as f:
             conv_data = json.load(f)
-            print(f"Conversation file contents: {json.dumps(conv_data, indent=2)}")
+        self.assertEqual(conv_data["id"], "test-conv-1")
         
         # Create a new store and load from the same directory
         new_store = MessageStore(save_dir=self.temp_dir)
         
         # Check that the action was loaded
         loaded_conv = new_store.get_conversation("test-conv-1")
-        print(f"Loaded conversation: {loaded_conv}")
-        if loaded_conv:
-            print(f"Loaded conversation actions: {loaded_conv.actions}")
-        
-        # Check store contents
-        print(f"New store conversations: {list(new_store.conversations.keys())}")
         
         self.assertIsNotNone(loaded_conv)
         self.assertEqual(len(loaded_conv.actions), 1)
         self.assertEqual(loaded_conv.actions[0].action_type, "button_click")
         self.assertEqual(loaded_conv.actions[0].data, {"button_id": "submit"})
     
+    def test_add_message_appends_to_log(self):
+        """Test that messages are appended to the log and replayed on load."""
+        conversation = self.store.create_conversation(
+            id="test-conv-1",
+            title="Test Conversation"
+        )
+        
+        for i in range(3):
+            self.store.add_message(conversation.id, f"Message {i}", role="user")
+        
+        # The snapshot is untouched; the messages live in the log
+        conv_file = Path(self.temp_dir) / "conversations" / "test-conv-1.json"
+        log_file = Path(self.temp_dir) / "conversations" / "test-conv-1.jsonl"
+        with open(conv_file, 'r') as f:
+            self.assertEqual(json.load(f)["messages"], [])
+        with open(log_file, 'r') as f:
+            self.assertEqual(len(f.readlines()), 3)
+        
+        new_store = MessageStore(save_dir=self.temp_dir)
+        loaded_conv = new_store.get_conversation("test-conv-1")
+        
+        self.assertEqual(
+            [m.content for m in loaded_conv.messages],
+            ["Message 0", "Message 1", "Message 2"]
+        )
+    
+    def test_log_compaction(self):
+        """Test that a long log is folded back into the snapshot."""
+        conversation = self.store.create_conversation(id="test-conv-1")
+        
+        num_messages = self.store.backend.COMPACT_MIN_RECORDS + 1
+        for i in range(num_messages):
+            self.store.add_message(conversation.id, f"Message {i}", role="user")
+        
+        conv_file = Path(self.temp_dir) / "conversations" / "test-conv-1.json"
+        log_file = Path(self.temp_dir) / "conversations" / "test-conv-1.jsonl"
+        with open(conv_file, 'r') as f:
+            self.assertEqual(len(json.load(f)["messages"]), num_messages)
+        self.assertFalse(log_file.exists())
+        
+        new_store = MessageStore(save_dir=self.temp_dir)
+        self.assertEqual(len(new_store.get_conversation("test-conv-1").messages), num_messages)
+    
+    def test_store_index_written_once(self):
+        """Test that the store index is only rewritten for new conversations."""
+        self.store.create_conversation(id="test-conv-1")
+        store_file = Path(self.temp_dir) / "message_store.json"
+        store_file.unlink()
+        
+        # A known conversation doesn't touch the index again
+        self.store.backend.compact("test-conv-1")
+        self.assertFalse(store_file.exists())
+        
+        self.store.create_conversation(id="test-conv-2")
+        with open(store_file, 'r') as f:
+            self.assertEqual(json.load(f)["conversation_ids"], ["test-conv-2"])
+    
+    def test_concurrent_add_message(self):
+        """Test that messages added from several threads are all persisted."""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        num_messages = self.store.backend.COMPACT_MIN_RECORDS * 2
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(
+                lambda i: self.store.add_message("test-conv-1", f"Message {i}"),
+                range(num_messages)
+            ))
+        
+        self.assertEqual(len(self.store.get_conversation("test-conv-1").messages), num_messages)
+        new_store = MessageStore(save_dir=self.temp_dir)
+        loaded_contents = {m.content for m in new_store.get_conversation("test-conv-1").messages}
+        self.assertEqual(loaded_contents, {f"Message {i}" for i in range(num_messages)})
+    
+    def test_concurrent_new_conversations(self):
+        """Test that conversations created from several threads are all listed in the store index."""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(
+                lambda i: self.store.add_message(f"test-conv-{i}", f"Message {i}"),
+                range(64)
+            ))
+        
+        with open(Path(self.temp_dir) / "message_store.json") as f:
+            self.assertEqual(len(json.load(f)["conversation_ids"]), 64)
+        new_store = MessageStore(save_dir=self.temp_dir)
+        self.assertEqual(len(new_store.get_all_conversations()), 64)
+        self.assertEqual(new_store.get_conversation("test-conv-7").messages[0].content, "Message 7")
+    
+    def test_write_behind(self):
+        """Test that buffered messages are written in one batch on flush."""
+        store = MessageStore(save_dir=self.temp_dir, flush_interval=60)
+        store.create_conversation(id="test-conv-1")
+        for i in range(3):
+            store.add_message("test-conv-1", f"Message {i}")
+        
+        log_file = Path(self.temp_dir) / "conversations" / "test-conv-1.jsonl"
+        self.assertFalse(log_file.exists())
+        self.assertEqual(len(store.get_conversation("test-conv-1").messages), 3)
+        
+        store.close()
+        with open(log_file, 'r') as f:
+            self.assertEqual(len(f.readlines()), 3)
+        new_store = MessageStore(save_dir=self.temp_dir)
+        self.assertEqual(
+            [m.content for m in new_store.get_conversation("test-conv-1").messages],
+            ["Message 0", "Message 1", "Message 2"]
+        )
+    
+    def test_flush_every(self):
+        """Test that buffered messages are written once a conversation has flush_every of them."""
+        store = MessageStore(save_dir=self.temp_dir, flush_every=3)
+        store.create_conversation(id="test-conv-1")
+        log_file = Path(self.temp_dir) / "conversations" / "test-conv-1.jsonl"
+        
+        for i in range(2):
+            store.add_message("test-conv-1", f"Message {i}")
+        self.assertFalse(log_file.exists())
+        
+        store.add_message("test-conv-1", "Message 2")
+        with open(log_file, 'r') as f:
+            self.assertEqual(len(f.readlines()), 3)
+        store.close()
+    
+    def test_batch(self):
+        """Test that messages added in a batch are written when it exits."""
+        self.store.create_conversation(id="test-conv-1")
+        log_file = Path(self.temp_dir) / "conversations" / "test-conv-1.jsonl"
+        
+        with self.store.batch():
+            for i in range(3):
+                self.store.add_message("test-conv-1", f"Message {i}")
+            self.assertFalse(log_file.exists())
+        
+        with open(log_file, 'r') as f:
+            self.assertEqual(len(f.readlines()), 3)
+    
     def test_direct_modification(self):
         """Test modifying a conversation directly."""
         # Create a conversation
@@ -155,19 +274,13 @@ class TestFileMessageStore(unittest.TestCase):
         conv_file = Path(self.temp_dir) / "conversations" / "test-conv-1.json"
         with open(conv_file, 'r') as f:
             conv_data = json.load(f)
-            print(f"Conversation file contents: {json.dumps(conv_data, indent=2)}")
+        self.assertEqual(conv_data["id"], "test-conv-1")
         
         # Create a new store and load from the same directory
         new_store = MessageStore(save_dir=self.temp_dir)
         
         # Check that the modified title was saved
         loaded_conv = new_store.get_conversation("test-conv-1")
-        print(f"Loaded conversation: {loaded_conv}")
-        if loaded_conv:
-            print(f"Loaded conversation title: {loaded_conv.title}")
-        
-        # Check store contents
-        print(f"New store conversations: {list(new_store.conversations.keys())}")
         
         self.assertIsNotNone(loaded_conv)
         self.assertEqual(loaded_conv.title, "Modified Title")
@@ -236,6 +349,39 @@ class TestMemoryMessageStore(unittest.TestCase):
         self.assertEqual(action.action_type, "button_click")
         self.assertEqual(action.data, {"button_id": "submit"})
     
+    def test_as_openai_messages(self):
+        """Test that the OpenAI-format history tracks added messages."""
+        self.store.add_message("test-conv-1", "Hello", role="user")
+        conversation = self.store.get_conversation("test-conv-1")
+        openai_messages = conversation.as_openai_messages()
+        
+        self.store.add_message("test-conv-1", "Hi there", role="assistant")
+        conversation.messages.append(Message(content="Direct", role="user"))
+        
+        self.assertIs(conversation.as_openai_messages(), openai_messages)
+        self.assertEqual(openai_messages, [
+            {"role": "user", "content": "Hello"},
+            {"role": "assistant", "content": "Hi there"},
+            {"role": "user", "content": "Direct"},
+        ])
+        self.assertNotIn("_openai_messages", conversation.model_dump())
+    
+    def test_total_tokens(self):
+        """Test that token counts are computed once per message."""
+        counted = []
+        
+        def count_words(text):
+            counted.append(text)
+            return len(text.split())
+        
+        self.store.add_message("test-conv-1", "one two three")
+        conversation = self.store.get_conversation("test-conv-1")
+        self.assertEqual(conversation.total_tokens(count_words), 3)
+        
+        self.store.add_message("test-conv-1", "four five", role="assistant")
+        self.assertEqual(conversation.total_tokens(count_words), 5)
+        self.assertEqual(counted, ["one two three", "four five"])
+    
     def test_get_conversation(self):
         """Test getting a conversation."""
         # Create a conversation
@@ -267,6 +413,23 @@ class TestMemoryMessageStore(unittest.TestCase):
         self.assertIn("test-conv-1", conversation_ids)
         self.assertIn("test-conv-2", conversation_ids)
     
+    def test_to_dict_reflects_direct_edits(self):
+        """Test that to_dict reflects in-place edits and returns fresh dicts each call."""
+        conv1 = self.store.create_conversation(id="test-conv-1")
+        self.store.add_message(conv1.id, "hi", role="user")
+        first = self.store.to_dict()["conversations"]
+        
+        conv1.metadata["topic"] = "greetings"
+        conv1.messages[0].content = "hello"
+        self.store.add_message(conv1.id, "Another", role="user")
+        second = self.store.to_dict()["conversations"]
+        
+        self.assertEqual(second["test-conv-1"]["metadata"], {"topic": "greetings"})
+        self.assertEqual(second["test-conv-1"]["messages"][0]["content"], "hello")
+        # The earlier snapshot isn't shared with the store or its backend
+        self.assertEqual(len(first["test-conv-1"]["messages"]), 1)
+        self.assertEqual(first["test-conv-1"]["metadata"], {})
+    
     def test_serialization(self):
         """Test serializing and deserializing a message store."""
         # Create some conversations with messages and actions
@@ -0,0 +1,322 @@
+import asyncio
+import threading
+import unittest
+
+import orjson
+
+from src.aral.agent import BaseAgent
+
+
+class RecordingAgent(BaseAgent):
+    """Agent that records the messages passed to its handler."""
+    
+    def init(self):
+        self.handled = []
+    
+    async def _handle_message(self, convo_id, message):
+        self.handled.append(message)
+        return f"Reply {len(self.handled)}"
+
+
+class TestBaseAgent(unittest.TestCase):
+    """Test BaseAgent message handling."""
+    
+    def test_on_message(self):
+        """Test that a message and its response are stored."""
+        agent = BaseAgent()
+        
+        response = asyncio.run(agent.on_message("test-conv-1", "Hello"))
+        
+        self.assertEqual(response, "Echo: Hello")
+        messages = agent.message_store.get_conversation_messages("test-conv-1")
+        self.assertEqual([(m.role, m.content) for m in messages], [("user", "Hello"), ("assistant", "Echo: Hello")])
+    
+    def test_get_conversations_json(self):
+        """Test that the cached JSON matches get_conversations and tracks new messages."""
+        agent = BaseAgent()
+        asyncio.run(agent.on_message("test-conv-1", "Hello"))
+        
+        self.assertEqual(orjson.loads(agent.get_conversations_json()), {"conversations": agent.get_conversations()})
+        
+        asyncio.run(agent.on_message("test-conv-1", "Again"))
+        conversations = orjson.loads(agent.get_conversations_json())["conversations"]
+        self.assertEqual(len(conversations[0]["messages"]), 4)
+        self.assertEqual(conversations, agent.get_conversations())
+        
+        chunks = list(agent.iter_conversations_json(chunk_size=1))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b"".join(chunks), agent.get_conversations_json())
+    
+    def test_handler_receives_conversation(self):
+        """Test that handlers declaring a conversation parameter are passed it."""
+        class HistoryAgent(BaseAgent):
+            def _handle_message(self, convo_id, message, conversation):
+                return f"{len(conversation.messages)} messages"
+        
+        agent = HistoryAgent()
+        
+        self.assertEqual(asyncio.run(agent.on_message("test-conv-1", "Hello")), "1 messages")
+        self.assertEqual(asyncio.run(agent.on_message("test-conv-1", "Again")), "3 messages")
+    
+    def test_exact_response_cache(self):
+        """Test that a repeated message is only answered from the cache after the same history."""
+        agent = RecordingAgent(cache="exact")
+        
+        first = asyncio.run(agent.on_message("test-conv-1", "What's up?"))
+        second = asyncio.run(agent.on_message("test-conv-2", "what's  up?"))
+        
+        # Both conversations were empty, so the reply can be reused
+        self.assertEqual(first, second)
+        self.assertEqual(len(agent.handled), 1)
+        messages = agent.message_store.get_conversation_messages("test-conv-2")
+        self.assertEqual([m.role for m in messages], ["user", "assistant"])
+        
+        asyncio.run(agent.on_message("test-conv-1", "Why?"))
+        asyncio.run(agent.on_message("test-conv-3", "Something else"))
+        # Same message, different history: a cache miss
+        self.assertEqual(asyncio.run(agent.on_message("test-conv-3", "why?")), "Reply 4")
+        self.assertEqual(len(agent.handled), 4)
+    
+    def test_semantic_cache_embeds_off_loop(self):
+        """Test that a semantic lookup embeds the message with its context once, in a worker thread."""
+        calls = []
+        
+        def embed(text):
+            calls.append((text, threading.current_thread() is threading.main_thread()))
+            return [1.0, 0.0]
+        
+        agent = RecordingAgent(cache="semantic", cache_embed=embed)
+        asyncio.run(agent.on_message("test-conv-1", "Hello"))
+        
+        self.assertEqual(calls, [("user: Hello", False)])
+    
+    def test_semantic_cache_requires_embed(self):
+        """Test that a semantic cache can't be created without an embedding function."""
+        with self.assertRaises(ValueError):
+            BaseAgent(cache="semantic")
+    
+    def test_coalesce_messages(self):
+        """Test that messages sent in quick succession are handled as one turn."""
+        agent = RecordingAgent(coalesce_window=0.05)
+        
+        async def send_burst():
+            return await asyncio.gather(
+                agent.on_message("test-conv-1", "hey"),
+                agent.on_message("test-conv-1", "actually"),
+                agent.on_message("test-conv-2", "hello"),
+            )
+        
+        responses = asyncio.run(send_burst())
+        
+        self.assertEqual(len(agent.handled), 2)
+        self.assertIn("- hey\n- actually", agent.handled[0])
+        self.assertEqual(responses[0], responses[1])
+        messages = agent.message_store.get_conversation_messages("test-conv-1")
+        self.assertEqual([m.role for m in messages], ["user", "assistant"])
+        self.assertEqual(messages[0].content, agent.handled[0])
+    
+    def test_coalesce_history(self):
+        """Test that a handler reading the history sees a coalesced batch as one turn."""
+        class HistoryAgent(BaseAgent):
+            def _handle_message(self, convo_id, message, conversation):
+                return " | ".join(m["content"] for m in conversation.as_openai_messages())
+        
+        agent = HistoryAgent(coalesce_window=60, coalesce_max_messages=2)
+        
+        async def send_burst():
+            return await asyncio.gather(
+                agent.on_message("test-conv-1", "hey"),
+                agent.on_message("test-conv-1", "actually"),
+            )
+        
+        response = asyncio.run(asyncio.wait_for(send_burst(), timeout=5))[0]
+        self.assertEqual(response, "The user sent these messages in quick succession:\n- hey\n- actually")
+    
+    def test_coalesce_max_messages(self):
+        """Test that a full batch is handled without waiting for the window."""
+        agent = RecordingAgent(coalesce_window=60, coalesce_max_messages=2)
+        
+        async def send_burst():
+            return await asyncio.gather(
+                agent.on_message("test-conv-1", "one"),
+                agent.on_message("test-conv-1", "two"),
+            )
+        
+        responses = asyncio.run(asyncio.wait_for(send_burst(), timeout=5))
+        
+        self.assertEqual(responses, ["Reply 1", "Reply 1"])
+    
+    def test_coalesce_with_cache(self):
+        """Test that coalesced turns are cached and answered from the cache."""
+        agent = RecordingAgent(cache="exact", coalesce_window=0.01)
+        
+        first = asyncio.run(agent.on_message("test-conv-1", "What's up?"))
+        second = asyncio.run(agent.on_message("test-conv-2", "what's up?"))
+        
+        self.assertEqual(first, second)
+        self.assertEqual(len(agent.handled), 1)
+        messages = agent.message_store.get_conversation_messages("test-conv-2")
+        self.assertEqual([(m.role, m.content) for m in messages], [("user", "what's up?"), ("assistant", first)])
+    
+    def test_call_llm_retries_rate_limits(self):
+        """Test that rate-limited calls are retried and other errors are not."""
+        class RateLimitError(Exception):
+            status_code = 429
+        
+        agent = BaseAgent(llm_max_retries=2)
+        agent.LLM_RETRY_BASE_DELAY = 0
+        attempts = []
+        
+        async def flaky_create(prompt):
+            attempts.append(prompt)
+            if len(attempts) < 3:
+                raise RateLimitError()
+            return f"Done: {prompt}"
+        
+        self.assertEqual(asyncio.run(agent.call_llm(flaky_create, "hi")), "Done: hi")
+        self.assertEqual(len(attempts), 3)
+        
+        async def failing_create():
+            raise ValueError("bad request")
+        
+        with self.assertRaises(ValueError):
+            asyncio.run(agent.call_llm(failing_create))
+    
+    def test_call_llm_limits_concurrency(self):
+        """Test that no more than max_llm_concurrency calls run at once."""
+        agent = BaseAgent(max_llm_concurrency=2)
+        running = []
+        peak = []
+        
+        async def create():
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+        
+        async def fan_out():
+            await asyncio.gather(*(agent.call_llm(create) for _ in range(6)))
+        
+        asyncio.run(fan_out())
+        self.assertEqual(max(peak), 2)
+    
+    def test_llm_stream(self):
+        """Test that a stream holds its concurrency slot until closed and rate-limited opens are retried."""
+        class RateLimitError(Exception):
+            status_code = 429
+        
+        class Stream:
+            closed = False
+            
+            async def __aenter__(self):
+                return self
+            
+            async def __aexit__(self, *exc_info):
+                self.closed = True
+        
+        agent = BaseAgent(max_llm_concurrency=1, llm_max_retries=1)
+        agent.LLM_RETRY_BASE_DELAY = 0
+        attempts = []
+        
+        async def open_stream():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RateLimitError()
+            return Stream()
+        
+        async def consume():
+            async with agent.llm_stream(open_stream) as stream:
+                self.assertTrue(agent._llm_semaphore.locked())
+            return stream
+        
+        stream = asyncio.run(consume())
+        self.assertTrue(stream.closed)
+        self.assertEqual(len(attempts), 2)
+        # Each event loop gets its own semaphore
+        self.assertIsInstance(asyncio.run(agent.call_llm(open_stream)), Stream)
+    
+    def test_send_update_batches(self):
+        """Test that closely spaced updates are delivered as one batch."""
+        agent = BaseAgent()
+        
+        async def collect():
+            updates = agent.updates("test-conv-1")
+            first_batch = asyncio.ensure_future(updates.__anext__())
+            await asyncio.sleep(0)  # Let the subscription start
+            agent.send_update("test-conv-2", {"step": "ignored"})
+            for step in range(3):
+                agent.send_update("test-conv-1", {"step": step})
+            batch = await asyncio.wait_for(first_batch, timeout=5)
+            await updates.aclose()
+            return orjson.loads(batch)
+        
+        batch = asyncio.run(collect())
+        
+        self.assertEqual(batch, [{"step": 0}, {"step": 1}, {"step": 2}])
+        self.assertEqual(agent._update_queues, {})
+    
+    def test_send_update_fans_out(self):
+        """Test that every subscriber to a conversation receives its updates."""
+        agent = BaseAgent()
+        
+        async def collect():
+            subscribers = [agent.updates("test-conv-1") for _ in range(2)]
+            batches = [asyncio.ensure_future(updates.__anext__()) for updates in subscribers]
+            await asyncio.sleep(0)  # Let the subscriptions start
+            agent.send_update("test-conv-1", {"step": 0})
+            results = await asyncio.wait_for(asyncio.gather(*batches), timeout=5)
+            for updates in subscribers:
+                await updates.aclose()
+            return [orjson.loads(batch) for batch in results]
+        
+        self.assertEqual(asyncio.run(collect()), [[{"step": 0}], [{"step": 0}]])
+        self.assertEqual(agent._update_queues, {})
+    
+    def test_send_update_drops_progress_when_full(self):
+        """Test that a full queue drops progress updates but keeps tool results."""
+        agent = BaseAgent()
+        agent.UPDATE_QUEUE_SIZE = 3
+        
+        async def collect():
+            updates = agent.updates("test-conv-1")
+            first_batch = asyncio.ensure_future(updates.__anext__())
+            await asyncio.sleep(0)  # Let the subscription start
+            for step in range(4):
+                agent.send_update("test-conv-1", {"type": "progress_update", "step": step})
+            agent.send_update("test-conv-1", {"type": "tool_result", "result": "done"})
+            batch = await asyncio.wait_for(first_batch, timeout=5)
+            await updates.aclose()
+            return orjson.loads(batch)
+        
+        batch = asyncio.run(collect())
+        
+        self.assertEqual(batch, [
+            {"type": "progress_update", "step": 2},
+            {"type": "progress_update", "step": 3},
+            {"type": "tool_result", "result": "done"},
+        ])
+    
+    def test_send_update_coalesces_progress(self):
+        """Test that progress updates for the same operation replace each other."""
+        agent = BaseAgent()
+        
+        async def collect():
+            updates = agent.updates("test-conv-1")
+            first_batch = asyncio.ensure_future(updates.__anext__())
+            await asyncio.sleep(0)  # Let the subscription start
+            for percent in (10, 50, 90):
+                agent.send_update("test-conv-1", {"type": "progress_update", "id": "wait-1", "percent": percent})
+            agent.send_update("test-conv-1", {"type": "progress_update", "id": "wait-2", "percent": 5})
+            batch = await asyncio.wait_for(first_batch, timeout=5)
+            await updates.aclose()
+            return orjson.loads(batch)
+        
+        batch = asyncio.run(collect())
+        
+        self.assertEqual(batch, [
+            {"type": "progress_update", "id": "wait-1", "percent": 90},
+            {"type": "progress_update", "id": "wait-2", "percent": 5},
+        ])
+
+if __name__ == "__main__":
+    unittest.main()
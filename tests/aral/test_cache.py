@@ -0,0 +1,53 @@
+import unittest
+
+from src.aral.cache import SemanticCache
+
+
+class TestSemanticCache(unittest.TestCase):
+    """Test the SemanticCache response cache."""
+
+    def test_exact_match_ignores_case_and_whitespace(self):
+        """Test that normalized prompts share a cache entry."""
+        cache = SemanticCache()
+        cache.put("What's the weather  in NYC?", "Sunny")
+
+        self.assertEqual(cache.get("what's the weather in nyc?"), "Sunny")
+        self.assertIsNone(cache.get("What's the weather in Boston?"))
+
+    def test_semantic_match(self):
+        """Test that similar embeddings hit and dissimilar ones miss."""
+        vectors = {
+            "weather in nyc?": [1.0, 0.0],
+            "what's the ny weather": [0.99, 0.05],
+            "tell me a joke": [0.0, 1.0],
+        }
+        cache = SemanticCache(embed=lambda text: vectors[text.lower()], threshold=0.9)
+        cache.put("weather in NYC?", "Sunny")
+
+        self.assertEqual(cache.get("what's the NY weather"), "Sunny")
+        self.assertIsNone(cache.get("tell me a joke"))
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted."""
+        cache = SemanticCache(max_entries=2)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("a"), "1")
+        self.assertIsNone(cache.get("b"))
+
+    def test_scope(self):
+        """Test that entries only match lookups in the same scope."""
+        cache = SemanticCache(embed=lambda text: [1.0, 0.0])
+        cache.put("yes", "Great, booking it", scope="a")
+
+        self.assertEqual(cache.get("yes", scope="a"), "Great, booking it")
+        self.assertIsNone(cache.get("yes", scope="b"))
+        self.assertIsNone(cache.get("yep", scope="b"))
+
+
+if __name__ == "__main__":
+    unittest.main()
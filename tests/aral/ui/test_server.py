@@ -0,0 +1,151 @@
+import gzip
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.aral.agent import BaseAgent
+from src.aral.ui.server import FrontendStaticFiles, UIServer
+
+
+class TestUIServerAPI(unittest.TestCase):
+    """Test the UIServer API routes against an in-memory agent."""
+    
+    def setUp(self):
+        """Create an echo agent and a test client for its API."""
+        self.agent = BaseAgent()
+        self.client = TestClient(UIServer(self.agent, api_only=True).app)
+    
+    def test_handle_message(self):
+        """Test that posting a message returns the agent's response."""
+        response = self.client.post(
+            "/api/message",
+            json={"conversation_id": "test-conv-1", "message": "Hello"}
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/json")
+        self.assertEqual(response.json(), {"response": "Echo: Hello"})
+    
+    def test_handle_message_requires_fields(self):
+        """Test that a message without a conversation ID is rejected."""
+        response = self.client.post("/api/message", json={"message": "Hello"})
+        
+        self.assertEqual(response.status_code, 422)
+    
+    def test_stream_message(self):
+        """Test that the streaming route sends the reply as server-sent events."""
+        response = self.client.post(
+            "/api/message/stream",
+            json={"conversation_id": "test-conv-1", "message": "Hello"}
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        self.assertEqual(
+            response.text,
+            'data: {"delta":"Echo: Hello"}\n\nevent: done\ndata: {}\n\n'
+        )
+        messages = self.agent.message_store.get_conversation_messages("test-conv-1")
+        self.assertEqual([m.content for m in messages], ["Hello", "Echo: Hello"])
+    
+    def test_get_conversations(self):
+        """Test that conversations are returned with their messages."""
+        self.client.post(
+            "/api/message",
+            json={"conversation_id": "test-conv-1", "message": "Hello"}
+        )
+        
+        response = self.client.get("/api/conversations")
+        
+        self.assertEqual(response.status_code, 200)
+        conversations = response.json()["conversations"]
+        self.assertEqual(len(conversations), 1)
+        self.assertEqual(conversations[0]["id"], "test-conv-1")
+        self.assertEqual(
+            [m["content"] for m in conversations[0]["messages"]],
+            ["Hello", "Echo: Hello"]
+        )
+
+    def test_get_conversations_gzip(self):
+        """Test that large API responses are gzipped when the client accepts it."""
+        self.client.post(
+            "/api/message",
+            json={"conversation_id": "test-conv-1", "message": "Hello " * 500}
+        )
+        
+        response = self.client.get("/api/conversations", headers={"Accept-Encoding": "gzip"})
+        
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(len(response.json()["conversations"][0]["messages"]), 2)
+    
+    def test_sync_on_message_agent(self):
+        """Test that agents with a synchronous on_message are still served."""
+        class SyncAgent(BaseAgent):
+            def on_message(self, convo_id, message):
+                return f"Sync: {message}"
+        
+        client = TestClient(UIServer(SyncAgent(), api_only=True).app)
+        response = client.post(
+            "/api/message",
+            json={"conversation_id": "test-conv-1", "message": "Hello"}
+        )
+        
+        self.assertEqual(response.json(), {"response": "Sync: Hello"})
+
+
+
+class TestFrontendStaticFiles(unittest.TestCase):
+    """Test serving the Next.js static export."""
+    
+    def setUp(self):
+        """Create a fake static export in a temporary directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        static_dir = Path(self.temp_dir) / "_next" / "static"
+        static_dir.mkdir(parents=True)
+        (static_dir / "app-1234.js").write_text("console.log('hi')")
+        (Path(self.temp_dir) / "index.html").write_text("<html></html>")
+        
+        app = FastAPI()
+        app.mount("/", FrontendStaticFiles(directory=self.temp_dir, html=True))
+        self.client = TestClient(app)
+    
+    def tearDown(self):
+        """Clean up the temporary directory."""
+        shutil.rmtree(self.temp_dir)
+    
+    def test_hashed_assets_are_immutable(self):
+        """Test that build assets get a long-lived immutable Cache-Control."""
+        response = self.client.get("/_next/static/app-1234.js")
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["cache-control"], FrontendStaticFiles.IMMUTABLE_CACHE_CONTROL)
+    
+    def test_other_files_are_revalidated(self):
+        """Test that other files rely on ETag revalidation."""
+        response = self.client.get("/")
+        self.assertNotIn("cache-control", response.headers)
+        
+        response = self.client.get("/", headers={"if-none-match": response.headers["etag"]})
+        self.assertEqual(response.status_code, 304)
+    
+    def test_precompressed_sibling(self):
+        """Test that a .gz sibling is served when the client accepts gzip."""
+        asset = Path(self.temp_dir) / "_next" / "static" / "app-1234.js"
+        Path(f"{asset}.gz").write_bytes(gzip.compress(asset.read_bytes()))
+        
+        response = self.client.get("/_next/static/app-1234.js", headers={"accept-encoding": "gzip"})
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertTrue(response.headers["content-type"].startswith("text/javascript"))
+        self.assertEqual(response.text, "console.log('hi')")
+        
+        response = self.client.get("/_next/static/app-1234.js", headers={"accept-encoding": "identity"})
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+
+
+if __name__ == "__main__":
+    unittest.main()